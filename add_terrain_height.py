@@ -0,0 +1,321 @@
+#************************************************************
+# -*- coding: cp1252 -*-
+#************************************************************
+#-------------------------------------------------------------------------------
+# Name:        add_terrain_height.py
+#
+# Purpose:     The registers only have the height above ground (AGL_M_M), but
+#              the surface penetrations depend on the height above mean sea
+#              level. This script reads the terrain height from a digital
+#              elevation model (DEM) at every obstacle location and adds the
+#              columns TERRAIN_M, AMSL_M and AMSL_FT to the obstacle table.
+#
+#              The DEM can be an ESRI float grid (.flt + .hdr), which is opened
+#              memory-mapped with numpy, or a GeoTIFF, which is read with
+#              rasterio. The obstacles are grouped by DEM tile, and only one
+#              tile of the DEM is read into memory at a time, so a DEM of the
+#              whole of Finland never has to fit in RAM. The heights are
+#              interpolated bilinearly from the four nearest cells.
+#
+#              The DEM can be in WGS84 (EPSG:4326) or ETRS-TM35FIN (EPSG:3067)
+#              coordinates.
+#
+# Author:      Mira Kajo - Autumn 2026
+#
+#-------------------------------------------------------------------------------
+
+# Import necessary modules
+import os
+import numpy as np
+import pandas as pd
+from calculate_surface_penetration import M_TO_FT, convert_coords_to_DecDeg
+
+
+# ==============================================================================
+
+#                            DEFINE FUNCTIONS
+
+# ==============================================================================
+
+
+def latlon_to_tm35fin(lat, lon):
+    '''
+    Converts WGS84/ETRS89 coordinates into ETRS-TM35FIN (EPSG:3067) with the
+    transverse mercator formulas of JHS 154.
+
+    PARAMETERS
+    ----------
+    Latitudes and longitudes in decimal degrees as numpy arrays.
+
+    RETURNS
+    -------
+    Two numpy arrays - easting (x) and northing (y) in meters.
+    '''
+    a = 6378137.0
+    f = 1 / 298.257222101
+    k0 = 0.9996
+    lon0 = np.radians(27.0)
+    false_e = 500000.0
+
+    n = f / (2 - f)
+    A1 = a / (1 + n) * (1 + n ** 2 / 4 + n ** 4 / 64)
+    e = np.sqrt(f * (2 - f))
+    h = [n / 2 - 2 * n ** 2 / 3 + 5 * n ** 3 / 16 + 41 * n ** 4 / 180,
+         13 * n ** 2 / 48 - 3 * n ** 3 / 5 + 557 * n ** 4 / 1440,
+         61 * n ** 3 / 240 - 103 * n ** 4 / 140,
+         49561 * n ** 4 / 161280]
+
+    phi = np.radians(lat)
+    lam = np.radians(lon)
+
+    Q = np.arcsinh(np.tan(phi)) - e * np.arctanh(e * np.sin(phi))
+    beta = np.arctan(np.sinh(Q))
+    eta_ = np.arctanh(np.cos(beta) * np.sin(lam - lon0))
+    xi_ = np.arcsin(np.sin(beta) * np.cosh(eta_))
+
+    xi = xi_.copy()
+    eta = eta_.copy()
+    for i, hi in enumerate(h, start=1):
+        xi += hi * np.sin(2 * i * xi_) * np.cosh(2 * i * eta_)
+        eta += hi * np.cos(2 * i * xi_) * np.sinh(2 * i * eta_)
+
+    return (A1 * eta * k0 + false_e, A1 * xi * k0)
+
+
+def open_dem(dem_fp, crs='EPSG:3067'):
+    '''
+    Opens a DEM without reading it into memory.
+
+    ESRI float grids (.flt) are opened with numpy.memmap, using the header
+    (.hdr) next to them. GeoTIFFs are opened with rasterio and read one window
+    at a time.
+
+    PARAMETERS
+    ----------
+    Filepath to the DEM and its coordinate system ('EPSG:3067' or
+    'EPSG:4326').
+
+    RETURNS
+    -------
+    A dictionary with the size, location, cell size and nodata value of the
+    DEM and a function that reads a window of rows and columns.
+    '''
+    if crs not in ('EPSG:3067', 'EPSG:4326'):
+        raise ValueError('Unsupported DEM coordinate system: {0}'.format(crs))
+
+    if dem_fp.lower().endswith('.flt'):
+        header = {}
+        with open(os.path.splitext(dem_fp)[0] + '.hdr', 'r') as inp:
+            for line in inp:
+                parts = line.split()
+                if len(parts) == 2:
+                    header[parts[0].lower()] = parts[1]
+
+        nrows = int(header['nrows'])
+        ncols = int(header['ncols'])
+        cellsize = float(header['cellsize'])
+
+        # The header gives the lower left corner (or the center of the lower
+        # left cell) --> upper left corner
+        x0 = float(header.get('xllcorner', header.get('xllcenter', 0)))
+        y0 = float(header.get('yllcorner', header.get('yllcenter', 0)))
+        if 'xllcenter' in header:
+            x0 -= cellsize / 2
+            y0 -= cellsize / 2
+        y0 += nrows * cellsize
+
+        byteorder = '>' if header.get('byteorder', 'LSBFIRST').upper() == 'MSBFIRST' else '<'
+        grid = np.memmap(dem_fp, dtype=byteorder + 'f4', mode='r', shape=(nrows, ncols))
+
+        def read_window(r0, r1, c0, c1):
+            return np.array(grid[r0:r1, c0:c1], dtype=np.float64)
+
+        nodata = float(header.get('nodata_value', -9999))
+
+    else:
+        import rasterio
+        from rasterio.windows import Window
+
+        src = rasterio.open(dem_fp)
+        nrows, ncols = src.height, src.width
+        x0, y0 = src.transform.c, src.transform.f
+        cellsize = src.transform.a
+
+        if abs(abs(src.transform.e) - cellsize) > 1e-9 * cellsize:
+            raise ValueError('The DEM cells must be square')
+
+        def read_window(r0, r1, c0, c1):
+            return src.read(1, window=Window(c0, r0, c1 - c0, r1 - r0)).astype(np.float64)
+
+        nodata = src.nodata if src.nodata is not None else np.nan
+
+    dem = {'nrows': nrows,
+           'ncols': ncols,
+           'x0': x0,
+           'y0': y0,
+           'cellsize': cellsize,
+           'nodata': nodata,
+           'crs': crs,
+           'read_window': read_window}
+
+    return dem
+
+
+def interpolate_window(window, rows, cols, nodata):
+    '''
+    Interpolates heights bilinearly inside one window of the DEM. If some of
+    the four cells have no data, the height is calculated from the others.
+
+    PARAMETERS
+    ----------
+    The window as numpy array, the fractional row and column of each point
+    inside the window (cell centers at whole numbers) and the nodata value.
+
+    RETURNS
+    -------
+    A numpy array of heights (NaN if all four cells have no data).
+    '''
+    r = np.clip(np.floor(rows).astype(np.int64), 0, window.shape[0] - 1)
+    c = np.clip(np.floor(cols).astype(np.int64), 0, window.shape[1] - 1)
+    r2 = np.minimum(r + 1, window.shape[0] - 1)
+    c2 = np.minimum(c + 1, window.shape[1] - 1)
+    fy = np.clip(rows - r, 0, 1)
+    fx = np.clip(cols - c, 0, 1)
+
+    values = np.stack([window[r, c], window[r, c2], window[r2, c], window[r2, c2]])
+    weights = np.stack([(1 - fy) * (1 - fx), (1 - fy) * fx, fy * (1 - fx), fy * fx])
+
+    valid = ~np.isnan(values)
+    if not np.isnan(nodata):
+        valid &= values != nodata
+
+    weights = np.where(valid, weights, 0.0)
+    total = weights.sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        heights = (np.where(valid, values, 0.0) * weights).sum(axis=0) / total
+
+    heights[total == 0] = np.nan
+
+    return heights
+
+
+def sample_dem(dem, x, y, tile_size=2048):
+    '''
+    Reads the terrain height at the given coordinates. The points are grouped
+    by DEM tile (tile_size x tile_size cells) and each tile is read once.
+
+    PARAMETERS
+    ----------
+    DEM opened with open_dem(), the coordinates in the coordinate system of
+    the DEM as numpy arrays and the size of a tile in cells.
+
+    RETURNS
+    -------
+    A numpy array of terrain heights in meters (NaN outside the DEM).
+    '''
+    # Fractional row and column of each point, cell centers at whole numbers
+    cols = (x - dem['x0']) / dem['cellsize'] - 0.5
+    rows = (dem['y0'] - y) / dem['cellsize'] - 0.5
+
+    heights = np.full(len(x), np.nan)
+    inside = ((rows > -0.5) & (rows < dem['nrows'] - 0.5) &
+              (cols > -0.5) & (cols < dem['ncols'] - 0.5))
+
+    pos = np.flatnonzero(inside)
+    tile_r = np.floor(np.clip(rows[pos], 0, None) / tile_size).astype(np.int64)
+    tile_c = np.floor(np.clip(cols[pos], 0, None) / tile_size).astype(np.int64)
+    tiles = pd.DataFrame({'tr': tile_r, 'tc': tile_c}).groupby(['tr', 'tc']).indices
+
+    for (tr, tc), idx in tiles.items():
+        p = pos[idx]
+
+        # One extra cell on each side for the interpolation
+        r0 = max(int(tr) * tile_size - 1, 0)
+        c0 = max(int(tc) * tile_size - 1, 0)
+        r1 = min((int(tr) + 1) * tile_size + 1, dem['nrows'])
+        c1 = min((int(tc) + 1) * tile_size + 1, dem['ncols'])
+
+        window = dem['read_window'](r0, r1, c0, c1)
+        heights[p] = interpolate_window(window, rows[p] - r0, cols[p] - c0, dem['nodata'])
+
+    return heights
+
+
+def add_terrain_height(obstacles, dem, n_col='COORD_N', e_col='COORD_E', agl_col='AGL_M_M'):
+    '''
+    Adds the terrain height and the height above mean sea level of every
+    obstacle to the table. The AMSL_FT column can be given to
+    build_register_index() in calculate_surface_penetration.py as the height
+    column.
+
+    PARAMETERS
+    ----------
+    The obstacles as pandas DataFrame, DEM opened with open_dem() and the
+    coordinate and height above ground columns.
+
+    RETURNS
+    -------
+    The DataFrame with new columns TERRAIN_M, AMSL_M and AMSL_FT.
+    '''
+    lat = convert_coords_to_DecDeg(obstacles[n_col])
+    lon = convert_coords_to_DecDeg(obstacles[e_col])
+
+    if dem['crs'] == 'EPSG:3067':
+        x, y = latlon_to_tm35fin(lat, lon)
+    else:
+        x, y = lon, lat
+
+    terrain = sample_dem(dem, x, y)
+
+    obstacles = obstacles.copy()
+    obstacles['TERRAIN_M'] = np.round(terrain, 2)
+    obstacles['AMSL_M'] = np.round(terrain + pd.to_numeric(obstacles[agl_col], errors='coerce').to_numpy(), 2)
+    obstacles['AMSL_FT'] = np.round(obstacles['AMSL_M'] * M_TO_FT, 1)
+
+    missing = int(np.isnan(terrain).sum())
+    if missing:
+        print('---> {0} obstacles are outside the DEM or on nodata cells'.format(missing))
+
+    return obstacles
+
+
+def add_terrain_height_from_file(obstacles, dem_fp, crs='EPSG:3067'):
+    '''
+    Opens the DEM and runs add_terrain_height(). Used as a stage in
+    run_pipeline.py, where the parameters must be plain values (the opened
+    DEM cannot be hashed).
+
+    PARAMETERS
+    ----------
+    The obstacles as pandas DataFrame, filepath to the DEM and its coordinate
+    system.
+
+    RETURNS
+    -------
+    The DataFrame with new columns TERRAIN_M, AMSL_M and AMSL_FT.
+    '''
+    return add_terrain_height(obstacles, open_dem(dem_fp, crs=crs))
+
+
+# ==============================================================================
+
+#                      RUNNING THE SCRIPT
+
+# ==============================================================================
+
+if __name__ == '__main__':
+
+    # Set input and output filepaths
+    register_csv = r'I:\GIS\Filepath_to_cache\obstacle_register.csv'
+    dem_fp = r'I:\GIS\Filepath_to_DEM\Finland_DEM_10m.flt'
+    output_csv = r'I:\GIS\Filepath_to_cache\obstacle_register_amsl.csv'
+
+    register = pd.read_csv(register_csv, encoding='latin-1', dtype={'COORD_N': str, 'COORD_E': str})
+
+    dem = open_dem(dem_fp, crs='EPSG:3067')
+    register = add_terrain_height(register, dem)
+
+    register.to_csv(output_csv, sep=',', index=False, encoding='latin-1')
+
+    print('DATA PROCESSING IS READY!')
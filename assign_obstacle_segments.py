@@ -0,0 +1,369 @@
+#************************************************************
+# -*- coding: cp1252 -*-
+#************************************************************
+#-------------------------------------------------------------------------------
+# Name:        assign_obstacle_segments.py
+#
+# Purpose:     The SEGMENT of each obstacle is kept up to date by hand in the
+#              registers and is often out of date. This script calculates the
+#              segment of every obstacle from the airspace/surface segment
+#              polygons (GeoPackage or GeoJSON) and reports the obstacles
+#              whose stored SEGMENT differs from the calculated one.
+#
+#              The register is sorted by latitude once (build_register_index()
+#              in calculate_surface_penetration.py), so each polygon only tests
+#              the obstacles inside its bounding box. The point in polygon test
+#              is done for all these obstacles at once with numpy.
+#
+#              The polygons must be in WGS84 (EPSG:4326) coordinates.
+#
+# Author:      Mira Kajo - Autumn 2026
+#
+#-------------------------------------------------------------------------------
+
+# Import necessary modules
+import json
+import struct
+import sqlite3
+import numpy as np
+import pandas as pd
+from calculate_surface_penetration import build_register_index, get_bbox_candidates
+from output_sinks import output_sink, write_chunk
+
+
+# ==============================================================================
+
+#                            DEFINE FUNCTIONS
+
+# ==============================================================================
+
+
+def normalize_segment(value):
+    '''
+    Converts a segment name into a stripped string, so that e.g. 12, 12.0 from
+    a numeric column and ' 12' are the same segment.
+
+    PARAMETERS
+    ----------
+    The segment name (any type).
+
+    RETURNS
+    -------
+    The name as string, or None if it is empty.
+    '''
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        value = int(value)
+
+    value = str(value).strip()
+
+    return value if value else None
+
+
+def make_polygon(name, rings):
+    '''
+    Creates a polygon record from a list of rings. Holes and the parts of a
+    multipolygon are all just rings, as the point in polygon test counts the
+    crossings of every ring.
+
+    PARAMETERS
+    ----------
+    Name of the segment and a list of rings ([[lon, lat], ...]).
+
+    RETURNS
+    -------
+    A dictionary with the name, rings (numpy arrays) and bounding box
+    (min lat, min lon, max lat, max lon).
+    '''
+    rings = [np.asarray(ring, dtype=float)[:, :2] for ring in rings if len(ring) >= 3]
+    coords = np.concatenate(rings)
+
+    polygon = {'name': normalize_segment(name),
+               'rings': rings,
+               'bbox': (coords[:, 1].min(), coords[:, 0].min(),
+                        coords[:, 1].max(), coords[:, 0].max())}
+
+    return polygon
+
+
+def read_geojson_polygons(input_fp, name_field='SEGMENT'):
+    '''
+    Reads the segment polygons from a GeoJSON -file.
+
+    PARAMETERS
+    ----------
+    Filepath to the GeoJSON -file and the property that has the segment name.
+
+    RETURNS
+    -------
+    A list of polygons created with make_polygon().
+    '''
+    with open(input_fp, 'r', encoding='utf-8') as inp:
+        data = json.load(inp)
+
+    polygons = []
+    for feature in data['features']:
+        geom = feature['geometry']
+
+        if geom['type'] == 'Polygon':
+            rings = geom['coordinates']
+        elif geom['type'] == 'MultiPolygon':
+            rings = [ring for part in geom['coordinates'] for ring in part]
+        else:
+            continue
+
+        polygons.append(make_polygon(feature['properties'][name_field], rings))
+
+    return polygons
+
+
+def parse_wkb_rings(wkb, offset=0):
+    '''
+    Reads the rings of a WKB Polygon or MultiPolygon.
+
+    PARAMETERS
+    ----------
+    The WKB as bytes and the position where the geometry starts.
+
+    RETURNS
+    -------
+    A tuple (list of rings as numpy arrays, position after the geometry).
+    '''
+    endian = '<' if wkb[offset] == 1 else '>'
+    geom_type = struct.unpack_from(endian + 'I', wkb, offset + 1)[0]
+    offset += 5
+
+    # ISO WKB: 1000 = Z, 2000 = M, 3000 = ZM
+    n_dims = {0: 2, 1: 3, 2: 3, 3: 4}[geom_type // 1000]
+    geom_type = geom_type % 1000
+
+    if geom_type == 3:
+        n_rings = struct.unpack_from(endian + 'I', wkb, offset)[0]
+        offset += 4
+
+        rings = []
+        for i in range(n_rings):
+            n_points = struct.unpack_from(endian + 'I', wkb, offset)[0]
+            offset += 4
+            ring = np.frombuffer(wkb, dtype=endian + 'f8', count=n_points * n_dims, offset=offset)
+            rings.append(ring.reshape(n_points, n_dims)[:, :2])
+            offset += n_points * n_dims * 8
+
+        return (rings, offset)
+
+    if geom_type == 6:
+        n_parts = struct.unpack_from(endian + 'I', wkb, offset)[0]
+        offset += 4
+
+        rings = []
+        for i in range(n_parts):
+            part_rings, offset = parse_wkb_rings(wkb, offset)
+            rings.extend(part_rings)
+
+        return (rings, offset)
+
+    raise ValueError('Only Polygon and MultiPolygon geometries are supported, got type {0}'.format(geom_type))
+
+
+def read_gpkg_polygons(input_fp, layer=None, name_field='SEGMENT'):
+    '''
+    Reads the segment polygons from a GeoPackage layer. The GeoPackage is an
+    SQLite database, so it is read with sqlite3 without GIS libraries.
+
+    PARAMETERS
+    ----------
+    Filepath to the GeoPackage, name of the layer (the first layer if None)
+    and the column that has the segment name.
+
+    RETURNS
+    -------
+    A list of polygons created with make_polygon().
+    '''
+    con = sqlite3.connect(input_fp)
+
+    try:
+        sql = 'SELECT table_name, column_name, srs_id FROM gpkg_geometry_columns'
+        if layer is None:
+            layer_info = con.execute(sql).fetchone()
+        else:
+            layer_info = con.execute(sql + ' WHERE table_name = ?', (layer,)).fetchone()
+
+        if layer_info is None:
+            raise ValueError('Layer {0} not found from {1}'.format(layer, input_fp))
+
+        table, geom_col, srs_id = layer_info
+        if srs_id != 4326:
+            raise ValueError('The polygons of {0} must be in EPSG:4326, not {1}'.format(table, srs_id))
+
+        polygons = []
+        for name, blob in con.execute('SELECT "{0}", "{1}" FROM "{2}"'.format(name_field, geom_col, table)):
+            if blob is None:
+                continue
+
+            # GeoPackage header: 'GP', version, flags and an envelope whose
+            # size is given in the flags
+            blob = bytes(blob)
+            envelope = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}[(blob[3] >> 1) & 7]
+            rings, end = parse_wkb_rings(blob, 8 + envelope)
+
+            polygons.append(make_polygon(name, rings))
+
+    finally:
+        con.close()
+
+    return polygons
+
+
+def read_polygons(input_fp, name_field='SEGMENT', layer=None):
+    '''
+    Reads the segment polygons from a GeoPackage (.gpkg) or GeoJSON -file.
+
+    PARAMETERS
+    ----------
+    Filepath to the file, the column that has the segment name and the layer
+    of the GeoPackage.
+
+    RETURNS
+    -------
+    A list of polygons created with make_polygon().
+    '''
+    if input_fp.lower().endswith('.gpkg'):
+        return read_gpkg_polygons(input_fp, layer, name_field)
+
+    return read_geojson_polygons(input_fp, name_field)
+
+
+def points_in_polygon(px, py, rings, block_size=4000000):
+    '''
+    Tests which points are inside a polygon (ray casting, even-odd rule). The
+    points are tested against all edges at once, in blocks so that the memory
+    use stays small for polygons with many vertices.
+
+    PARAMETERS
+    ----------
+    Longitudes and latitudes of the points as numpy arrays, the rings of the
+    polygon and the maximum number of point-edge pairs in one block.
+
+    RETURNS
+    -------
+    A numpy boolean array.
+    '''
+    x1 = np.concatenate([ring[:, 0] for ring in rings])
+    y1 = np.concatenate([ring[:, 1] for ring in rings])
+    x2 = np.concatenate([np.roll(ring[:, 0], -1) for ring in rings])
+    y2 = np.concatenate([np.roll(ring[:, 1], -1) for ring in rings])
+
+    # Horizontal edges are never crossed by the ray
+    keep = y1 != y2
+    x1, y1, x2, y2 = x1[keep], y1[keep], x2[keep], y2[keep]
+
+    inside = np.zeros(len(px), dtype=bool)
+    step = max(1, block_size // max(1, len(x1)))
+
+    for start in range(0, len(px), step):
+        bx = px[start:start + step, None]
+        by = py[start:start + step, None]
+
+        crosses = ((y1 > by) != (y2 > by)) & (bx < (x2 - x1) * (by - y1) / (y2 - y1) + x1)
+        inside[start:start + step] = np.count_nonzero(crosses, axis=1) % 2 == 1
+
+    return inside
+
+
+def assign_segments(index, polygons):
+    '''
+    Calculates the segment of every obstacle. If the polygons overlap, the
+    obstacle gets the segment of the first polygon in the list.
+
+    PARAMETERS
+    ----------
+    Index created with build_register_index() and a list of polygons.
+
+    RETURNS
+    -------
+    A numpy array of segment names (None = outside all polygons) in the same
+    order as the rows of the register.
+    '''
+    n_points = len(index['lat'])
+    computed = np.full(n_points, None, dtype=object)
+    assigned = np.zeros(n_points, dtype=bool)
+
+    for polygon in polygons:
+        cand = get_bbox_candidates(index, polygon['bbox'])
+        cand = cand[~assigned[cand]]
+        if len(cand) == 0:
+            continue
+
+        hit = cand[points_in_polygon(index['lon'][cand], index['lat'][cand], polygon['rings'])]
+        computed[hit] = polygon['name']
+        assigned[hit] = True
+
+    # Back to the order of the register (obstacles without coordinates are
+    # not in the index --> None)
+    segments = np.full(index['n_rows'], None, dtype=object)
+    segments[index['rows']] = computed
+
+    return segments
+
+
+def get_segment_mismatches(register, segments, index, id_col='ID', segment_col='SEGMENT'):
+    '''
+    Compares the stored SEGMENT values with the calculated ones. Both are
+    compared as stripped strings (see normalize_segment()). Obstacles without
+    readable coordinates have no calculated segment, so they are left out of
+    the report.
+
+    PARAMETERS
+    ----------
+    The register as pandas DataFrame, the segments from assign_segments(),
+    index created with build_register_index() and the ID and segment columns.
+
+    RETURNS
+    -------
+    A pandas DataFrame (OBST_ID, SEGMENT, SEGMENT_COMPUTED) of the obstacles
+    whose segments differ.
+    '''
+    stored = np.array([normalize_segment(value) for value in register[segment_col]], dtype=object)
+    computed = np.array([normalize_segment(value) for value in segments], dtype=object)
+
+    located = np.zeros(len(register), dtype=bool)
+    located[index['rows']] = True
+
+    differ = np.array([a != b for a, b in zip(stored, computed)], dtype=bool) & located
+
+    mismatches = pd.DataFrame({'OBST_ID': register[id_col].to_numpy()[differ],
+                               'SEGMENT': stored[differ],
+                               'SEGMENT_COMPUTED': computed[differ]})
+
+    return mismatches
+
+
+# ==============================================================================
+
+#                      RUNNING THE SCRIPT
+
+# ==============================================================================
+
+if __name__ == '__main__':
+
+    # Set input and output filepaths
+    register_csv = r'I:\GIS\Filepath_to_cache\obstacle_register.csv'
+    segments_fp = r'I:\GIS\Filepath_to_segments\segments.gpkg'
+    output_csv = r'I:\GIS\Filepath_to_ouput_file\segment_mismatches.csv'
+
+    register = pd.read_csv(register_csv, encoding='latin-1',
+                           dtype={'COORD_N': str, 'COORD_E': str, 'SEGMENT': str})
+    register_index = build_register_index(register, height_col=None)
+
+    polygons = read_polygons(segments_fp)
+    segments = assign_segments(register_index, polygons)
+
+    mismatches = get_segment_mismatches(register, segments, register_index)
+    with output_sink(output_csv, list(mismatches.columns), encoding='latin-1') as sink:
+        write_chunk(sink, mismatches)
+
+    print('{0} obstacles have a different SEGMENT than their location'.format(len(mismatches)))
+    print('{0} obstacles have no location'.format(len(register) - len(register_index['rows'])))
+    print('DATA PROCESS IS DONE!')
@@ -0,0 +1,298 @@
+#************************************************************
+# -*- coding: cp1252 -*-
+#************************************************************
+#-------------------------------------------------------------------------------
+# Name:        batch_checkpoint.py
+#
+# Purpose:     Checkpoints for long batch runs (e.g. all 37 feature classes in
+#              fetch_signif_obst.py). Every finished unit of work (a feature
+#              class, a geodatabase read, ...) and its result are saved into a
+#              checkpoint folder. If the run stops because of a locked
+#              geodatabase or a network problem, the next run continues from
+#              the first unit that is not finished yet.
+#
+#              Units that fail with a temporary I/O error (a lock or a network
+#              problem) are retried a few times, waiting a bit longer after
+#              every try. Other errors stop the run straight away.
+#
+#              A finished unit is used again only if its source data has not
+#              changed since (and, if max_age_days is given, the unit is not
+#              older than that).
+#
+#              The results are saved the same way as the cached results in
+#              run_pipeline.py (DataFrames as Parquet, other results pickled).
+#
+# Author:      Mira Kajo - Autumn 2026
+#
+#-------------------------------------------------------------------------------
+
+# Import necessary modules
+import os
+import json
+import time
+import hashlib
+from datetime import datetime
+from run_pipeline import read_cached_result, write_cached_result
+
+
+# arcpy raises RuntimeError for every problem (also for a bad SQL clause or a
+# missing field) --> only errors with these words in the message are retried
+TRANSIENT_MESSAGES = ['lock', 'network', 'timed out', 'timeout', 'temporarily',
+                      'connection', 'being used by another process', 'unavailable']
+
+# OSErrors that will not go away by waiting
+PERMANENT_OS_ERRORS = (FileNotFoundError, NotADirectoryError, IsADirectoryError)
+
+
+# ==============================================================================
+
+#                            DEFINE FUNCTIONS
+
+# ==============================================================================
+
+
+def open_checkpoint(checkpoint_folder, run_name, max_age_days=None):
+    '''
+    Opens the checkpoint of a batch run. If the run has been stopped before,
+    the finished units are read from the checkpoint folder.
+
+    PARAMETERS
+    ----------
+    The folder where the checkpoints are saved, a name for the run (e.g.
+    'significant_flight_obst') and the age (days) after which finished units
+    are not used anymore (None = no limit).
+
+    RETURNS
+    -------
+    A dictionary that is given to run_unit().
+    '''
+    if not os.path.exists(checkpoint_folder):
+        os.makedirs(checkpoint_folder)
+
+    state_fp = os.path.join(checkpoint_folder, run_name + '.json')
+    done = {}
+
+    if os.path.exists(state_fp):
+        with open(state_fp, 'r') as inp:
+            done = json.load(inp)
+
+        # Units saved by an older version of this file have no dates
+        done = dict((key, info) for key, info in done.items() if isinstance(info, dict))
+        print('---> Continuing {0}: {1} units already done'.format(run_name, len(done)))
+
+    checkpoint = {'folder': checkpoint_folder,
+                  'run_name': run_name,
+                  'state_fp': state_fp,
+                  'max_age_days': max_age_days,
+                  'done': done}
+
+    return checkpoint
+
+
+def get_unit_fp(checkpoint, unit):
+    '''
+    Creates the filepath (without the file extension) of a unit's result.
+    Filepaths of feature classes are too long for filenames, so a hash of the
+    unit is used instead.
+
+    PARAMETERS
+    ----------
+    Checkpoint created with open_checkpoint() and the unit.
+
+    RETURNS
+    -------
+    Filepath without the file extension.
+    '''
+    unit_hash = hashlib.sha1(str(unit).encode('utf-8')).hexdigest()[:16]
+
+    return os.path.join(checkpoint['folder'], checkpoint['run_name'] + '_' + unit_hash)
+
+
+def save_state(checkpoint):
+    '''
+    Saves the list of finished units. The file is replaced in one go, so a
+    stopped run never leaves a broken state file.
+
+    PARAMETERS
+    ----------
+    Checkpoint created with open_checkpoint().
+
+    RETURNS
+    -------
+    None
+    '''
+    with open(checkpoint['state_fp'] + '.tmp', 'w') as out:
+        json.dump(checkpoint['done'], out, indent=2)
+
+    os.replace(checkpoint['state_fp'] + '.tmp', checkpoint['state_fp'])
+
+
+def is_transient_error(err):
+    '''
+    Checks if an error is temporary, i.e. worth retrying: a locked geodatabase
+    or a network problem. Missing files, bad SQL clauses, missing fields etc.
+    are not.
+
+    PARAMETERS
+    ----------
+    The error.
+
+    RETURNS
+    -------
+    True or False
+    '''
+    if isinstance(err, PERMANENT_OS_ERRORS):
+        return False
+
+    if isinstance(err, (ConnectionError, TimeoutError)):
+        return True
+
+    if isinstance(err, (OSError, RuntimeError)):
+        message = str(err).lower()
+        return any(word in message for word in TRANSIENT_MESSAGES)
+
+    return False
+
+
+def get_source_mtime(path):
+    '''
+    Finds when the source data of a unit was last modified. For a feature
+    class inside a geodatabase (...\\data.gdb\\EFHK), the newest file of the
+    geodatabase folder is used. The *.lock files that arcpy creates and
+    removes while reading, and the folder itself (its time changes with
+    them), are not looked at.
+
+    PARAMETERS
+    ----------
+    Filepath to the source data.
+
+    RETURNS
+    -------
+    Modification time in seconds, or None if the path is not found.
+    '''
+    path = str(path)
+
+    # Walk up from the feature class to an existing file or folder
+    while path and not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+    if not path:
+        return None
+
+    if os.path.isdir(path):
+        mtimes = [os.path.getmtime(os.path.join(path, name)) for name in os.listdir(path)
+                  if not name.lower().endswith('.lock')]
+        return max(mtimes) if mtimes else None
+
+    return os.path.getmtime(path)
+
+
+def retry_call(func, args=(), retries=3, backoff=5.0, is_transient=is_transient_error):
+    '''
+    Calls a function and tries again if it fails with a temporary error. The
+    wait time doubles after every try (5 s, 10 s, 20 s, ...).
+
+    PARAMETERS
+    ----------
+    The function, a tuple of its arguments, the number of retries, the first
+    wait time in seconds and a function that tells if an error is retried.
+
+    RETURNS
+    -------
+    The result of the function.
+    '''
+    attempt = 0
+
+    while True:
+        try:
+            return func(*args)
+
+        except Exception as err:
+            if attempt >= retries or not is_transient(err):
+                raise
+
+            wait = backoff * 2 ** attempt
+            print('---> {0} failed ({1}), trying again in {2} s'.format(
+                getattr(func, '__name__', func), err, wait))
+            time.sleep(wait)
+            attempt += 1
+
+
+def run_unit(checkpoint, unit, func, args=(), source=None, **retry_kwargs):
+    '''
+    Runs one unit of work, unless it has been finished in an earlier run, in
+    which case its saved result is returned. The saved result is not used if
+    the source data has changed since or the result is older than the
+    max_age_days of the checkpoint.
+
+    PARAMETERS
+    ----------
+    Checkpoint created with open_checkpoint(), a name for the unit (e.g. the
+    filepath of the feature class), the function, a tuple of its arguments,
+    the filepath (or a list of filepaths, if the result depends on several
+    sources) of the source data (the unit itself if None) and the parameters
+    of retry_call().
+
+    RETURNS
+    -------
+    The result of the function.
+    '''
+    unit_fp = get_unit_fp(checkpoint, unit)
+    key = str(unit)
+    source = unit if source is None else source
+
+    if isinstance(source, (list, tuple)):
+        source_mtime = [get_source_mtime(path) for path in source]
+    else:
+        source_mtime = get_source_mtime(source)
+
+    info = checkpoint['done'].get(key)
+    if info is not None:
+        age_days = (time.time() - info['finished']) / 86400.0
+
+        if info['source_mtime'] != source_mtime:
+            print('source changed, running again: {0}'.format(unit))
+        elif checkpoint['max_age_days'] is not None and age_days > checkpoint['max_age_days']:
+            print('older than {0} days, running again: {1}'.format(checkpoint['max_age_days'], unit))
+        else:
+            print('already done: {0}'.format(unit))
+            return read_cached_result(unit_fp)
+
+    result = retry_call(func, args, **retry_kwargs)
+
+    write_cached_result(unit_fp, result)
+    checkpoint['done'][key] = {'file': os.path.basename(unit_fp),
+                               'source_mtime': source_mtime,
+                               'finished': time.time(),
+                               'date': datetime.now().strftime('%Y-%m-%d %H:%M')}
+    save_state(checkpoint)
+
+    return result
+
+
+def clear_checkpoint(checkpoint):
+    '''
+    Removes the checkpoint after the whole run has finished, so that the next
+    run starts from the beginning with fresh data.
+
+    PARAMETERS
+    ----------
+    Checkpoint created with open_checkpoint().
+
+    RETURNS
+    -------
+    None
+    '''
+    for unit in checkpoint['done']:
+        unit_fp = get_unit_fp(checkpoint, unit)
+        for ext in ('.parquet', '.done', '.pkl'):
+            if os.path.exists(unit_fp + ext):
+                os.remove(unit_fp + ext)
+
+    if os.path.exists(checkpoint['state_fp']):
+        os.remove(checkpoint['state_fp'])
+
+    checkpoint['done'] = {}
@@ -0,0 +1,302 @@
+#************************************************************
+# -*- coding: cp1252 -*-
+#************************************************************
+#-------------------------------------------------------------------------------
+# Name:        build_obstacle_tiles.py
+#
+# Purpose:     Creates a tile pyramid of the flight obstacle points, so that a
+#              map viewer only needs to load the tiles that are visible
+#              instead of a shapefile with every obstacle of Finland.
+#
+#              The tiles are GeoJSON -files in the usual {z}/{x}/{y} folder
+#              structure (web mercator tiling). At low zoom levels the points
+#              are clustered into a grid: one feature per grid cell with the
+#              number of obstacles and the highest Delta and H(ft). At the
+#              higher zoom levels every obstacle is its own feature with its
+#              Id, Delta, H(ft) and TYPE.
+#
+#              The input points are saved next to the tiles. When the script
+#              is run again, only the tiles that have changed or removed
+#              obstacles are written again.
+#
+# Author:      Mira Kajo - Autumn 2026
+#
+#-------------------------------------------------------------------------------
+
+# Import necessary modules
+import os
+import json
+import numpy as np
+import pandas as pd
+
+
+# Attributes that are carried to the tiles if the input has them
+TILE_ATTRIBUTES = ['Id', 'Delta', 'H(ft)', 'TYPE']
+
+
+# ==============================================================================
+
+#                            DEFINE FUNCTIONS
+
+# ==============================================================================
+
+
+def to_world_coords(lat, lon):
+    '''
+    Converts decimal degrees into web mercator world coordinates, where the
+    whole world is between 0 and 1 in both directions (0, 0 = north west).
+
+    PARAMETERS
+    ----------
+    Latitudes and longitudes as numpy arrays.
+
+    RETURNS
+    -------
+    Two numpy arrays - x and y.
+    '''
+    lat_rad = np.radians(np.clip(lat, -85.0511, 85.0511))
+
+    wx = (lon + 180.0) / 360.0
+    wy = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0
+
+    return (wx, wy)
+
+
+def get_tile_xy(wx, wy, zoom):
+    '''
+    Calculates the tile of each point on a zoom level.
+
+    PARAMETERS
+    ----------
+    World coordinates from to_world_coords() and the zoom level.
+
+    RETURNS
+    -------
+    Two numpy arrays of tile numbers - x and y.
+    '''
+    n_tiles = 2 ** zoom
+
+    tx = np.clip(np.floor(wx * n_tiles), 0, n_tiles - 1).astype(np.int64)
+    ty = np.clip(np.floor(wy * n_tiles), 0, n_tiles - 1).astype(np.int64)
+
+    return (tx, ty)
+
+
+def make_tile(points, wx, wy, zoom, cluster, cell_px=64):
+    '''
+    Creates the GeoJSON features of one tile.
+
+    PARAMETERS
+    ----------
+    Points of the tile as pandas DataFrame (Latitude, Longitude and the tile
+    attributes), their world coordinates, the zoom level, whether the points
+    are clustered and the size of a cluster cell in pixels (tile = 256 px).
+
+    RETURNS
+    -------
+    A GeoJSON FeatureCollection as dictionary.
+    '''
+    attrs = [col for col in TILE_ATTRIBUTES if col in points.columns]
+
+    if cluster:
+        cells_per_world = 2 ** zoom * 256 // cell_px
+        cell = pd.DataFrame({'cx': np.floor(wx * cells_per_world).astype(np.int64),
+                             'cy': np.floor(wy * cells_per_world).astype(np.int64),
+                             'Latitude': points['Latitude'].to_numpy(),
+                             'Longitude': points['Longitude'].to_numpy()})
+
+        agg = {'Latitude': 'mean', 'Longitude': 'mean'}
+        for col in ('Delta', 'H(ft)'):
+            if col in points.columns:
+                cell[col] = pd.to_numeric(points[col], errors='coerce').to_numpy()
+                agg[col] = 'max'
+
+        grouped = cell.groupby(['cx', 'cy'])
+        clusters = grouped.agg(agg)
+        clusters['count'] = grouped.size()
+
+        records = clusters.reset_index(drop=True)
+        props = ['count'] + [col for col in ('Delta', 'H(ft)') if col in records.columns]
+    else:
+        records = points.reset_index(drop=True)
+        props = attrs
+
+    # Missing values as null instead of NaN, which is not valid JSON
+    records = records.astype(object).where(records.notna(), None)
+
+    features = []
+    for rec in records.to_dict('records'):
+        features.append({'type': 'Feature',
+                         'geometry': {'type': 'Point',
+                                      'coordinates': [round(float(rec['Longitude']), 6),
+                                                      round(float(rec['Latitude']), 6)]},
+                         'properties': dict((col, rec[col]) for col in props)})
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def write_tile(output_folder, zoom, x, y, tile):
+    '''
+    Saves one tile as {zoom}/{x}/{y}.geojson. The tile is written with a
+    temporary name first, so a viewer never reads a half written tile.
+
+    PARAMETERS
+    ----------
+    The tile folder, tile coordinates and the tile created with make_tile().
+
+    RETURNS
+    -------
+    None
+    '''
+    tile_folder = os.path.join(output_folder, str(zoom), str(x))
+    if not os.path.exists(tile_folder):
+        os.makedirs(tile_folder)
+
+    tile_fp = os.path.join(tile_folder, '{0}.geojson'.format(y))
+    with open(tile_fp + '.tmp', 'w', encoding='utf-8') as out:
+        json.dump(tile, out, default=str)
+
+    os.replace(tile_fp + '.tmp', tile_fp)
+
+
+def remove_tile(output_folder, zoom, x, y):
+    '''
+    Removes a tile that no longer has any obstacles.
+
+    PARAMETERS
+    ----------
+    The tile folder and tile coordinates.
+
+    RETURNS
+    -------
+    None
+    '''
+    tile_fp = os.path.join(output_folder, str(zoom), str(x), '{0}.geojson'.format(y))
+
+    if os.path.exists(tile_fp):
+        os.remove(tile_fp)
+
+
+def get_changed_points(points, previous):
+    '''
+    Compares the points with the points of the previous run.
+
+    PARAMETERS
+    ----------
+    The current and previous points as pandas DataFrames.
+
+    RETURNS
+    -------
+    A pandas DataFrame of the points that are new, changed or removed (the old
+    location of a moved obstacle is included, too).
+    '''
+    cols = ['Latitude', 'Longitude'] + [col for col in TILE_ATTRIBUTES if col in points.columns]
+
+    if list(previous.columns) != list(points.columns):
+        return pd.concat([points[cols], previous[[c for c in cols if c in previous.columns]]])
+
+    merged = points[cols].merge(previous[cols], on=cols, how='outer', indicator=True)
+
+    return merged[merged['_merge'] != 'both'][cols]
+
+
+def build_tiles(points, output_folder, min_zoom=4, max_zoom=14, cluster_max_zoom=9):
+    '''
+    Builds (or updates) the tile pyramid of the obstacle points.
+
+    On the first run every tile is written. On later runs only the tiles with
+    new, changed or removed obstacles are written again, unless the zoom
+    settings have changed.
+
+    PARAMETERS
+    ----------
+    The points as pandas DataFrame with columns Latitude, Longitude and the
+    tile attributes (e.g. the output of convert_to_DecDeg()), the tile folder,
+    the smallest and largest zoom level, and the largest zoom level where the
+    points are clustered.
+
+    RETURNS
+    -------
+    Number of tiles written or removed.
+    '''
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    points = points.reset_index(drop=True)
+    settings = {'min_zoom': min_zoom, 'max_zoom': max_zoom, 'cluster_max_zoom': cluster_max_zoom}
+
+    points_fp = os.path.join(output_folder, 'tile_points.parquet')
+    metadata_fp = os.path.join(output_folder, 'metadata.json')
+
+    # Find out which points have changed since the previous run
+    changed = None
+    if os.path.exists(points_fp) and os.path.exists(metadata_fp):
+        with open(metadata_fp, 'r') as inp:
+            metadata = json.load(inp)
+        if dict((key, metadata.get(key)) for key in settings) == settings:
+            changed = get_changed_points(points, pd.read_parquet(points_fp))
+
+    wx, wy = to_world_coords(points['Latitude'].astype(float).to_numpy(),
+                             points['Longitude'].astype(float).to_numpy())
+
+    if changed is not None:
+        cwx, cwy = to_world_coords(changed['Latitude'].astype(float).to_numpy(),
+                                   changed['Longitude'].astype(float).to_numpy())
+
+    count = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        tx, ty = get_tile_xy(wx, wy, zoom)
+        tiles = pd.DataFrame({'tx': tx, 'ty': ty}).groupby(['tx', 'ty']).indices
+
+        # All tiles on the first run, otherwise only the tiles of the
+        # changed points
+        if changed is None:
+            affected = set(tiles.keys())
+        else:
+            ctx, cty = get_tile_xy(cwx, cwy, zoom)
+            affected = set(zip(ctx.tolist(), cty.tolist()))
+
+        for (x, y) in affected:
+            rows = tiles.get((x, y))
+
+            if rows is None:
+                remove_tile(output_folder, zoom, x, y)
+            else:
+                tile = make_tile(points.iloc[rows], wx[rows], wy[rows], zoom,
+                                 cluster=(zoom <= cluster_max_zoom))
+                write_tile(output_folder, zoom, x, y, tile)
+            count += 1
+
+        print('zoom {0}: {1} tiles'.format(zoom, len(affected)))
+
+    # Save the points and settings for the next run
+    points.to_parquet(points_fp + '.tmp', index=False)
+    os.replace(points_fp + '.tmp', points_fp)
+
+    metadata = dict(settings)
+    metadata['bounds'] = [float(points['Longitude'].min()), float(points['Latitude'].min()),
+                          float(points['Longitude'].max()), float(points['Latitude'].max())]
+    metadata['tiles'] = '{z}/{x}/{y}.geojson'
+    with open(metadata_fp, 'w') as out:
+        json.dump(metadata, out, indent=2)
+
+    return count
+
+
+# ==============================================================================
+
+#                      RUNNING THE SCRIPT
+
+# ==============================================================================
+
+if __name__ == '__main__':
+
+    # Set input and output filepaths
+    input_csv = r'C:Path_to_output_file\VSS_Point_Coord.csv'
+    tile_folder = r'C:Path_to_output_folder\VSS_tiles'
+
+    points = pd.read_csv(input_csv)
+    n_tiles = build_tiles(points, tile_folder)
+
+    print('{0} tiles updated'.format(n_tiles))
+    print('DATA PROCESSING IS READY!')
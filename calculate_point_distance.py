@@ -23,6 +23,7 @@ import os
 import csv
 import numpy as np
 from datetime import datetime
+from batch_checkpoint import open_checkpoint, run_unit, clear_checkpoint
 
 
 # ==============================================================================
@@ -172,6 +173,9 @@ apron = 'EF_ACC_SECT_M'
 # NAMED IN THE SAME MANNER!
 gdb1_fp = r'I:\GIS\Filepath_to_first_GDB\INPUT\\' + apron + '\\' + apron + '.gdb\\' + apron
 
+# Finished distance calculations are saved here until the whole run is done
+checkpoint_folder = r'C:\TEMP\checkpoints'
+
 # Checking the filepath
 # ---------------------------
     # First, check if the endfile already exists for the subject
@@ -197,8 +201,13 @@ finalOutput = 'Relocated_' + apron + save_time + '.csv'
 
 # ==============================================================================
 
-# Run calculate_distance() - function
-relocated_list = calculate_distance(mml_fp)
+# If an earlier run for the same apron stopped after the distances were
+# calculated, they are taken from the checkpoint
+checkpoint = open_checkpoint(checkpoint_folder, 'Relocated_' + apron)
+
+# Run calculate_distance() - function, retrying if the I: -drive is not
+# reachable for a moment
+relocated_list = run_unit(checkpoint, gdb1_fp, calculate_distance, (gdb1_fp,))
 
 # Chech if the list is empty (--> does the file have any items that are defined
 # as Relocated during the analysis phase)
@@ -208,6 +217,9 @@ if len(relocated_list) == 0:
 else:
     get_distance_as_csv(relocated_list, finalOutput, apron)
 
+# All steps are done --> the next run starts from the beginning
+clear_checkpoint(checkpoint)
+
 
 print('DATA PROCESS IS DONE!')
 
@@ -0,0 +1,388 @@
+#************************************************************
+# -*- coding: cp1252 -*-
+#************************************************************
+#-------------------------------------------------------------------------------
+# Name:        calculate_surface_penetration.py
+#
+# Purpose:     Calculates which flight obstacles penetrate a pregiven surface
+#              (an inclined plane or a segmented surface) without the external
+#              tool that produces the VSS text files.
+#
+#              A surface is defined by its origin (N, E), track, start height
+#              and one or more segments (length and slope). The obstacle
+#              register is read once and sorted by latitude, so that each
+#              surface only needs to look at the obstacles inside its bounding
+#              box. The penetration height (Delta) is then calculated for all
+#              candidates at once with numpy.
+#
+#              The result is a CSV -file for each surface with the same columns
+#              as the VSS text file: Id, Delta, H(ft), N and E. The file can be
+#              given straight to convert_to_DecDeg() in
+#              Visual_Surface_Segment_obst.py.
+#
+# Author:      Mira Kajo - Autumn 2026
+#
+#-------------------------------------------------------------------------------
+
+# Import necessary modules
+import os
+import math
+import numpy as np
+import pandas as pd
+
+
+# Mean radius of the earth and feet in a meter
+EARTH_RADIUS_M = 6371008.8
+M_TO_FT = 3.28084
+
+
+# ==============================================================================
+
+#                            DEFINE FUNCTIONS
+
+# ==============================================================================
+
+
+def convert_coords_to_DecDeg(coords):
+    '''
+    Converts coordinates given as DDMMSSs (e.g. 6012345 -> 60 12' 34.5'') into
+    decimal degrees. Works the same way as convert_to_DecDeg() in
+    Visual_Surface_Segment_obst.py, but for a whole column at once.
+
+    PARAMETERS
+    ----------
+    A list, numpy array or pandas Series of coordinates.
+
+    RETURNS
+    -------
+    A numpy array of coordinates in decimal degrees. Missing coordinates and
+    coordinates that cannot be read are NaN, so one bad row of the register
+    does not stop the whole run.
+    '''
+    coord_str = pd.Series(coords, dtype=object)
+    coord_str = coord_str.where(coord_str.notna(), '').astype(str).str.strip().str.split('.').str[0]
+
+    # Two digits for degrees, two for minutes and the rest for tenths of seconds
+    parts = coord_str.str.extract(r'^(\d{2})(\d{2})(\d+)$')
+
+    deg = pd.to_numeric(parts[0], errors='coerce')
+    mins = pd.to_numeric(parts[1], errors='coerce')
+    sec = pd.to_numeric(parts[2], errors='coerce') / 10
+
+    bad = ((mins >= 60) | (sec >= 60)).to_numpy()
+    dec_deg = np.where(bad, np.nan, (deg + (mins / 60) + (sec / 3600)).to_numpy(dtype=float))
+
+    return dec_deg
+
+
+def to_local_xy(lat, lon, lat0, lon0):
+    '''
+    Projects decimal degree coordinates into meters east (x) and north (y) of
+    an origin. The surfaces are at most some tens of kilometers long, so a
+    simple equirectangular projection is accurate enough.
+
+    PARAMETERS
+    ----------
+    Latitudes and longitudes as numpy arrays and the origin in decimal degrees.
+
+    RETURNS
+    -------
+    Two numpy arrays - x and y in meters.
+    '''
+    x = np.radians(lon - lon0) * EARTH_RADIUS_M * math.cos(math.radians(lat0))
+    y = np.radians(lat - lat0) * EARTH_RADIUS_M
+
+    return (x, y)
+
+
+def define_surface(name, origin_n, origin_e, track, start_height_ft, segments,
+                   half_width=75.0, splay=0.15):
+    '''
+    Creates a surface that starts from the origin and rises along the track.
+
+    An inclined plane has only one segment. A segmented surface has several
+    segments, each starting from where the previous one ends. The surface
+    widens towards its end according to the splay (per side).
+
+    PARAMETERS
+    ----------
+    Name of the surface, origin coordinates (DDMMSSs), track in degrees, start
+    height in feet, a list of (length in meters, slope in percent) -tuples, the
+    half width at the origin in meters and the splay.
+
+    RETURNS
+    -------
+    A dictionary that describes the surface and its bounding box
+    (min lat, min lon, max lat, max lon).
+    '''
+    lat0 = convert_coords_to_DecDeg([origin_n])[0]
+    lon0 = convert_coords_to_DecDeg([origin_e])[0]
+
+    lengths = np.array([float(seg[0]) for seg in segments])
+    slopes = np.array([float(seg[1]) for seg in segments])
+
+    # Distance and height where each segment starts
+    seg_start = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+    rise_ft = lengths * slopes / 100 * M_TO_FT
+    seg_height_ft = start_height_ft + np.concatenate(([0.0], np.cumsum(rise_ft)[:-1]))
+
+    total_length = lengths.sum()
+    far_half_width = half_width + total_length * splay
+
+    # Corners of the surface (along, cross) --> back to decimal degrees for the
+    # bounding box
+    trk = math.radians(track)
+    along = np.array([0.0, 0.0, total_length, total_length])
+    cross = np.array([-half_width, half_width, -far_half_width, far_half_width])
+    x = along * math.sin(trk) + cross * math.cos(trk)
+    y = along * math.cos(trk) - cross * math.sin(trk)
+    lat = lat0 + np.degrees(y / EARTH_RADIUS_M)
+    lon = lon0 + np.degrees(x / (EARTH_RADIUS_M * math.cos(math.radians(lat0))))
+
+    surface = {'name': name,
+               'lat0': lat0,
+               'lon0': lon0,
+               'track': float(track),
+               'seg_start': seg_start,
+               'seg_slope': slopes,
+               'seg_height_ft': seg_height_ft,
+               'length': total_length,
+               'half_width': float(half_width),
+               'splay': float(splay),
+               'bbox': (lat.min(), lon.min(), lat.max(), lon.max())}
+
+    return surface
+
+
+def read_surfaces_from_csv(input_csv):
+    '''
+    Reads surface definitions from a CSV -file. Every row is one surface with
+    columns NAME, ORIGIN_N, ORIGIN_E, TRACK, START_FT, HALF_WIDTH, SPLAY and
+    SEGMENTS. The segments are written as 'length:slope' pairs separated with
+    ';' (e.g. '1500:3.33;3000:2.5').
+
+    PARAMETERS
+    ----------
+    Filepath to the CSV -file.
+
+    RETURNS
+    -------
+    A list of surfaces created with define_surface().
+    '''
+    surf_df = pd.read_csv(input_csv, dtype={'ORIGIN_N': str, 'ORIGIN_E': str})
+
+    surfaces = []
+    for idx, row in surf_df.iterrows():
+        segments = [seg.split(':') for seg in str(row['SEGMENTS']).split(';')]
+        surfaces.append(define_surface(row['NAME'], row['ORIGIN_N'], row['ORIGIN_E'],
+                                       row['TRACK'], row['START_FT'], segments,
+                                       row['HALF_WIDTH'], row['SPLAY']))
+
+    return surfaces
+
+
+def build_register_index(register, id_col='ID', n_col='COORD_N', e_col='COORD_E',
+                         height_col='AMSL_FT'):
+    '''
+    Converts the obstacle register into numpy columns sorted by latitude. The
+    sorting is done only once, after which every surface can find its
+    candidates with a binary search instead of going through the whole register.
+
+    PARAMETERS
+    ----------
+    The obstacle register as pandas DataFrame and the names of the ID,
+    coordinate and height (feet above mean sea level) columns. The register
+    has only the height above ground --> add AMSL_FT first with
+    add_terrain_height() in add_terrain_height.py. The height column can be
+    None if the index is not used for penetrations.
+
+    RETURNS
+    -------
+    A dictionary of numpy arrays (rows, id, n, e, lat, lon, height_ft), where
+    rows are the positions of the obstacles in the register, and the number
+    of rows in the register (n_rows). Obstacles with missing or unreadable
+    coordinates are left out of the index.
+    '''
+    lat = convert_coords_to_DecDeg(register[n_col])
+    lon = convert_coords_to_DecDeg(register[e_col])
+
+    valid = np.flatnonzero(~np.isnan(lat) & ~np.isnan(lon))
+    if len(valid) < len(register):
+        print('---> {0} obstacles have missing or unreadable coordinates and are skipped'.format(
+            len(register) - len(valid)))
+
+    order = valid[np.argsort(lat[valid], kind='mergesort')]
+
+    index = {'n_rows': len(register),
+             'rows': order,
+             'id': register[id_col].to_numpy()[order],
+             'n': register[n_col].to_numpy()[order],
+             'e': register[e_col].to_numpy()[order],
+             'lat': lat[order],
+             'lon': lon[order],
+             'height_ft': None}
+
+    if height_col is not None:
+        index['height_ft'] = pd.to_numeric(register[height_col], errors='coerce').to_numpy(dtype=float)[order]
+
+    return index
+
+
+def get_bbox_candidates(index, bbox):
+    '''
+    Fetches the positions of the obstacles that are inside a bounding box.
+
+    PARAMETERS
+    ----------
+    Index created with build_register_index() and a bounding box
+    (min lat, min lon, max lat, max lon).
+
+    RETURNS
+    -------
+    A numpy array of positions in the index.
+    '''
+    lo = np.searchsorted(index['lat'], bbox[0], side='left')
+    hi = np.searchsorted(index['lat'], bbox[2], side='right')
+
+    lon = index['lon'][lo:hi]
+    in_box = (lon >= bbox[1]) & (lon <= bbox[3])
+
+    return np.arange(lo, hi)[in_box]
+
+
+def get_surface_height(surface, along):
+    '''
+    Calculates the height of the surface (feet) at the given distances along
+    the track.
+
+    PARAMETERS
+    ----------
+    Surface created with define_surface() and a numpy array of distances in
+    meters.
+
+    RETURNS
+    -------
+    A numpy array of surface heights in feet.
+    '''
+    seg = np.searchsorted(surface['seg_start'], along, side='right') - 1
+    seg = np.clip(seg, 0, len(surface['seg_start']) - 1)
+
+    rise_ft = (along - surface['seg_start'][seg]) * surface['seg_slope'][seg] / 100 * M_TO_FT
+
+    return surface['seg_height_ft'][seg] + rise_ft
+
+
+def calculate_penetration(surface, index):
+    '''
+    Calculates the penetration height (Delta) of every obstacle that is inside
+    the surface and higher than it.
+
+    PARAMETERS
+    ----------
+    Surface created with define_surface() and index created with
+    build_register_index().
+
+    RETURNS
+    -------
+    A pandas DataFrame with columns Id, Delta, H(ft), N and E, sorted so that
+    the highest penetration is first.
+    '''
+    cand = get_bbox_candidates(index, surface['bbox'])
+
+    # Distance along the track and to the side of the track
+    x, y = to_local_xy(index['lat'][cand], index['lon'][cand], surface['lat0'], surface['lon0'])
+    trk = math.radians(surface['track'])
+    along = x * math.sin(trk) + y * math.cos(trk)
+    cross = x * math.cos(trk) - y * math.sin(trk)
+
+    inside = ((along >= 0) & (along <= surface['length']) &
+              (np.abs(cross) <= surface['half_width'] + along * surface['splay']))
+
+    delta = index['height_ft'][cand] - get_surface_height(surface, along)
+    hit = inside & (delta > 0)
+    cand = cand[hit]
+
+    vss_df = pd.DataFrame({'Id': index['id'][cand],
+                           'Delta': np.round(delta[hit], 1),
+                           'H(ft)': index['height_ft'][cand],
+                           'N': index['n'][cand],
+                           'E': index['e'][cand]})
+
+    return vss_df.sort_values('Delta', ascending=False).reset_index(drop=True)
+
+
+def calculate_all_penetrations(surfaces, index):
+    '''
+    Runs calculate_penetration() for a list of surfaces and combines the
+    results into one table (used as a stage in run_pipeline.py).
+
+    PARAMETERS
+    ----------
+    A list of surfaces and index created with build_register_index().
+
+    RETURNS
+    -------
+    A pandas DataFrame like in calculate_penetration(), with the name of the
+    surface in the column SURFACE.
+    '''
+    vss_dfs = [calculate_penetration(surface, index).assign(SURFACE=surface['name'])
+               for surface in surfaces]
+
+    return pd.concat(vss_dfs, ignore_index=True)
+
+
+def evaluate_surfaces(surfaces, index, output_folder):
+    '''
+    Runs calculate_penetration() for a list of surfaces and saves the result
+    of each surface in its own CSV -file (<name>_VSS.csv).
+
+    PARAMETERS
+    ----------
+    A list of surfaces, index created with build_register_index() and the
+    folder where the CSV -files will be saved.
+
+    RETURNS
+    -------
+    A dictionary where the surface name is the key and the DataFrame the value.
+    '''
+    results = {}
+
+    for surface in surfaces:
+        vss_df = calculate_penetration(surface, index)
+        vss_df.to_csv(os.path.join(output_folder, surface['name'] + '_VSS.csv'),
+                      sep=',', index=False)
+
+        print('{0}: {1} penetrating obstacles'.format(surface['name'], len(vss_df)))
+        results[surface['name']] = vss_df
+
+    return results
+
+
+# ==============================================================================
+
+#                      RUNNING THE SCRIPT
+
+# ==============================================================================
+
+# The functions above are also used by the other scripts --> run only when this
+# file is run as a script
+if __name__ == '__main__':
+
+    from add_terrain_height import open_dem, add_terrain_height
+
+    # Set input and output filepaths
+    register_csv = r'C:Path_to_input_file\obstacle_register.csv'
+    dem_fp = r'C:Path_to_input_file\Finland_DEM_10m.flt'
+    surfaces_csv = r'C:Path_to_input_file\VSS_surfaces.csv'
+    output_folder = r'C:Path_to_output_folder\VSS'
+
+    # Read the register only once and use it for all surfaces. The surfaces
+    # are compared with the height above mean sea level (AMSL_FT).
+    register = pd.read_csv(register_csv, dtype={'COORD_N': str, 'COORD_E': str})
+    register = add_terrain_height(register, open_dem(dem_fp, crs='EPSG:3067'))
+    register_index = build_register_index(register, height_col='AMSL_FT')
+
+    surface_list = read_surfaces_from_csv(surfaces_csv)
+    evaluate_surfaces(surface_list, register_index, output_folder)
+
+    print('DATA PROCESSING IS READY!')
@@ -12,6 +12,9 @@
 #              get_deleted_obst() - functions. The script returns only one CSV -
 #              file that contains information from all of Finland.
 #
+#              Needs Python 3 (ArcGIS Pro), as the rows are written with
+#              output_sinks.py.
+#
 # Author:      Mira Kajo - Spring 2018
 #
 #-------------------------------------------------------------------------------
@@ -20,8 +23,10 @@
 import arcpy
 import arcpy.da as da
 import os
-import csv
+import pandas as pd
 from datetime import datetime
+from output_sinks import output_sink, write_rows, write_partitioned
+from batch_checkpoint import open_checkpoint, run_unit, clear_checkpoint
 
 
 # ==============================================================================
@@ -65,7 +70,48 @@ def get_filepaths_as_list():
     return aerodrome_list
 
 
-def get_deleted_obst(workspace, output_csv):
+def get_deleted_rows(fpath):
+
+    '''
+    This function fetches the rows of one feature class that are going to be
+    deleted from LER.
+
+    PARAMETERS:
+    -----------
+        Filepath to the feature class.
+
+    RETURNS:
+    --------
+        A list of rows (lists).
+    '''
+
+    # Initialize the SQL statement
+    sql = "(PROCEDURE = 'remove' OR PROCEDURE = 'dismantle' OR PROCEDURE = 'Out of date') AND (READY = 'yes' AND AGL_M_M >= 100)"
+
+    # Create a SearchCursor
+    cursor = arcpy.SearchCursor(fpath, sql)
+
+    # Iterate over the feature class provided as input
+    rows = []
+    for rivi in cursor:
+
+        out_ID = str(rivi.ID)
+        out_type = str(rivi.TYPE)
+        out_agl = str(rivi.AGL_M_M)
+        out_ready = rivi.READY
+        out_return = str(rivi.RETURN_CODE)
+        out_procedure = str(rivi.PROCEDURE)
+        out_segment = rivi.SEGMENT
+        coord_n = rivi.COORD_N
+        coord_e = rivi.COORD_E
+
+        data = [out_ID, out_type, out_agl, out_ready, out_return, out_procedure, out_segment, coord_n, coord_e]
+        rows.append(data)
+
+    return rows
+
+
+def get_deleted_obst(workspace, output_csv, checkpoint_folder):
 
     '''
     This function fetches rows of data that are marked with specific command,
@@ -76,46 +122,58 @@ def get_deleted_obst(workspace, output_csv):
     workspace parameter to loop over, so that one can fetch data from all folders
     (airports) at once.
 
+    Every finished feature class is saved into the checkpoint folder. If the
+    run stops (e.g. a locked GDB), the next run continues from the feature
+    class where it stopped. Temporary I/O errors are retried.
+
     PARAMETERS:
     -----------
         A list of filepaths from get_filepaths_as_list() - function, an output
-        CSV filepath.
+        CSV filepath and the checkpoint folder.
 
     RETURNS:
     --------
         An CSV file with deleted flight obstacles that will be deleted from LER.
     '''
 
-    # Open the output file and write data into it
-    with open(output_csv, 'wb') as out_csv:
-        writer = csv.writer(out_csv)
-        writer.writerow(['OBST_ID', 'TYPE', 'AGL_M_M', 'READY', 'RETURN_CODE', 'PROCEDURE', 'SEGMENT', 'COORD_N', 'COORD_E' ])
+    columns = ['OBST_ID', 'TYPE', 'AGL_M_M', 'READY', 'RETURN_CODE', 'PROCEDURE', 'SEGMENT', 'COORD_N', 'COORD_E']
+
+    checkpoint = open_checkpoint(checkpoint_folder, 'significant_flight_obst')
 
-        # Initialize the SQL statement
-        sql = "(PROCEDURE = 'remove' OR PROCEDURE = 'dismantle' OR PROCEDURE = 'Out of date') AND (READY = 'yes' AND AGL_M_M >= 100)"
+    # Open the output file and write data into it. The rows are written in
+    # batches, and the file is saved only once all feature classes are done.
+    with output_sink(output_csv, columns, encoding='latin-1') as sink:
 
         # Loop over all filepaths one by one
         for fpath in workspace:
             print('processing: %s' % fpath)
 
-            # Create a SearchCursor
-            cursor = arcpy.SearchCursor(fpath, sql)
+            rows = run_unit(checkpoint, fpath, get_deleted_rows, (fpath,))
+            write_rows(sink, rows)
+
+    # All feature classes are done --> the next run starts from the beginning
+    clear_checkpoint(checkpoint)
+
+
+def write_partitioned_output(input_csv, output_fp, partition_col='SEGMENT'):
+    '''
+    Splits the CSV -file created with get_deleted_obst() into separate files
+    by a column (e.g. SEGMENT). The output format (CSV, gzip/zstd CSV,
+    Parquet) is taken from the file extension of output_fp.
 
-            # Iterate over the feature class provided as input
-            for rivi in cursor:
+    PARAMETERS:
+    -----------
+        Filepath to the CSV -file, filepath to the output file (the column
+        value is added to the filename) and the column used for splitting.
 
-                out_ID = str(rivi.ID)
-                out_type = str(rivi.TYPE)
-                out_agl = str(rivi.AGL_M_M)
-                out_ready = rivi.READY.encode('latin-1')
-                out_return = str(rivi.RETURN_CODE)
-                out_procedure = str(rivi.PROCEDURE).encode('latin-1')
-                out_segment = rivi.SEGMENT.encode('latin-1')
-                coord_n = rivi.COORD_N
-                coord_e = rivi.COORD_E
+    RETURNS:
+    --------
+        A dictionary where the column value is the key and the filepath the
+        value.
+    '''
+    data = pd.read_csv(input_csv, encoding='latin-1', dtype=str)
 
-                data = [out_ID, out_type, out_agl, out_ready, out_return, out_procedure, out_segment, coord_n, coord_e]
-                writer.writerow(data)
+    return write_partitioned(data, output_fp, partition_col)
 
 
 # ==============================================================================
@@ -130,11 +188,20 @@ time_stamp = datetime.now().strftime("_%Y%m%d_%H%M")
 # Create the output CSV's for both LER and CSV flight obstacle data
 outputLER_csv = r'I:\GIS\Filepath_to_ouput_file\significant_flight_obst' + time_stamp + '.csv'
 
+# Finished feature classes are saved here until the whole run is done
+checkpoint_folder = r'C:\TEMP\checkpoints'
+
 # Run the get_filepaths_as_list() - function to acquire a list of filepaths
 filepaths_list = get_filepaths_as_list()
 
 # Run the get_deleted_obst() - function
-get_deleted_obst(filepaths_list, outputLER_csv)
+get_deleted_obst(filepaths_list, outputLER_csv, checkpoint_folder)
+
+# --> SET A FILEPATH HERE TO ALSO SPLIT THE RESULT BY SEGMENT (e.g. *.parquet):
+outputLER_segments = None
+
+if outputLER_segments:
+    write_partitioned_output(outputLER_csv, outputLER_segments, 'SEGMENT')
 
 
 print('DATA PROCESS IS DONE!')
\ No newline at end of file
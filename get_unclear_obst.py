@@ -14,6 +14,9 @@
 #
 #              The script consists of three functions that are explained below.
 #
+#              Needs Python 3 (ArcGIS Pro), as the rows are written with
+#              output_sinks.py.
+#
 # Author:      Mira Kajo - Spring 2018
 #-------------------------------------------------------------------------------
 
@@ -21,9 +24,13 @@
 import arcpy
 from arcpy import env
 import os
-import csv
+import copy
+import queue
 import codecs
+import threading
 from datetime import datetime
+from output_sinks import output_sink, open_sink, write_rows, close_sink, abort_sink
+from batch_checkpoint import open_checkpoint, run_unit, clear_checkpoint
 
 
 # ==============================================================================
@@ -125,6 +132,30 @@ def get_related_records(inputFC, related_dict):
 
 
 
+def normalize_row(row):
+    '''
+    Makes a row of the dictionary exactly 8 values long. The rows created with
+    get_GDB1_ID_s() and get_related_records() can be shorter (the ID was not
+    found from the second Geodatabase) or longer (the ID was found twice, or
+    the first Geodatabase had the same ID twice).
+
+    PARAMETERS:
+    -----------
+        A row (list) of the dictionary.
+
+    RETURNS:
+    --------
+        A list of 8 values - the first 6 values of the row and the first OWNER
+        and DIAARI (None if they were not found).
+    '''
+
+    # Rows of duplicate IDs are added as lists --> leave them out
+    related = [value for value in row[6:] if not isinstance(value, list)]
+    related = (related + [None, None])[:2]
+
+    return list(row[:6]) + related
+
+
 def write_csv_from_dict(input_dict, output_csv):
     '''
     Writes a CSV-file from a dictionary given as input.
@@ -139,28 +170,187 @@ def write_csv_from_dict(input_dict, output_csv):
         CSV - file
     '''
 
-    # Open the filepath given as input
-    with open(output_csv, 'wb') as out_csv:
+    # Note: Excel will fail to open Python generated CSVs if the first line
+    # is 'ID' in all caps!
+    columns = ['OBST_ID', 'TYPE', 'AGL_M_M', 'READY', 'RETURN_CODE',
+               'SEGMENT', 'OWNER', 'DIAARI']
+
+    # Open the filepath given as input and write all rows as one batch. The
+    # output format is taken from the file extension (.csv, .csv.gz, .parquet)
+    with output_sink(output_csv, columns, encoding='latin-1') as sink:
+        write_rows(sink, [normalize_row(row) for row in input_dict.values()])
+
+    print('Unclear: {0} rows'.format(sink['count']))
+    print('\n ---> CSV - file is ready!')
+    print('\n ---> DATA PROCESSING IS DONE!')
+
+
+def write_csv_pipelined(gdb1_FC, gdb2_FC, output_csv, queue_size=10000, max_pending=200000):
+    '''
+    Does the same as get_GDB1_ID_s(), get_related_records() and
+    write_csv_from_dict() together, but reads both geodatabases at the same
+    time in their own threads.
+
+    The rows of the second geodatabase are collected only until the unclear
+    IDs of the first one are known (it is the smaller read). After that, every
+    matching row is joined straight away and sent to the writer thread through
+    a queue of limited size. This way the whole run takes about as long as the
+    slower of the two reads.
 
-        # Initialize writer and add header
-        w = csv.writer(out_csv, delimiter=",")
-        # Note: Excel will fail to open Python generated CSVs if the first line
-        # is 'ID' in all caps!
-        w.writerow(['OBST_ID', 'TYPE', 'AGL_M_M', 'READY', 'RETURN_CODE',
-                        'SEGMENT', 'OWNER', 'DIAARI'])
+    At most max_pending rows of the second geodatabase are collected. If the
+    first read has not finished by then, the second read waits for it, so
+    the reads overlap only for max_pending + queue_size rows. A smaller value
+    uses less memory, a larger one gives more overlap.
 
-        print('Unclear: ')
-        print('----------')
+    PARAMETERS:
+    -----------
+        Filepaths to the first and second Geodatabase, an output filepath,
+        the maximum number of rows waiting in each queue and the maximum
+        number of rows collected before the unclear IDs are known.
+
+    RETURNS:
+    --------
+        Number of rows written (0 --> no CSV -file is created)
+    '''
+
+    columns = ['OBST_ID', 'TYPE', 'AGL_M_M', 'READY', 'RETURN_CODE',
+               'SEGMENT', 'OWNER', 'DIAARI']
+
+    DONE = object()
+    related_q = queue.Queue(maxsize=queue_size)
+    out_q = queue.Queue(maxsize=queue_size)
+    unclear_done = threading.Event()
+    stop = threading.Event()
+    unclear = {}
+    errors = []
+    written = [0]
+
+    # Thread 1: unclear rows of the first geodatabase
+    def read_gdb1():
+        try:
+            unclear.update(get_GDB1_ID_s(gdb1_FC, {}))
+        except BaseException as err:
+            errors.append(err)
+        finally:
+            unclear_done.set()
+
+    # Thread 2: ID, OWNER and DIAARI of the second geodatabase
+    def read_gdb2():
+        try:
+            with arcpy.da.SearchCursor(gdb2_FC, ['ID', 'OWNER', 'DIAARI']) as cur:
+                for row in cur:
+                    if stop.is_set():
+                        break
+                    related_q.put((str(int(row[0])), row[1], row[2]))
+        except BaseException as err:
+            errors.append(err)
+        finally:
+            related_q.put(DONE)
+
+    # Thread 3: the writer --> the file is created at the first row
+    def write_output():
+        sink = None
+        try:
+            while True:
+                row = out_q.get()
+                if row is DONE:
+                    break
+                if sink is None:
+                    sink = open_sink(output_csv, columns, encoding='latin-1')
+                write_rows(sink, [row])
+
+            if sink is not None:
+                if errors:
+                    abort_sink(sink)
+                else:
+                    written[0] = close_sink(sink)
+
+        except BaseException as err:
+            errors.append(err)
+            stop.set()
+            if sink is not None:
+                abort_sink(sink)
+
+            # Keep emptying the queue so that the joining never gets stuck
+            while out_q.get() is not DONE:
+                pass
+
+    threads = [threading.Thread(target=read_gdb1),
+               threading.Thread(target=read_gdb2),
+               threading.Thread(target=write_output)]
+    for thread in threads:
+        thread.start()
+
+    # Join the rows in this thread
+    pending = {}
+    matched = set()
+    gdb2_done = False
+
+    def emit(ID_s, owner, diaari):
+        if ID_s in unclear and ID_s not in matched:
+            matched.add(ID_s)
+            out_q.put(unclear[ID_s][:6] + [owner, diaari])
+
+    try:
+        while True:
+            # Once the unclear IDs are known, the rows collected so far are joined
+            if pending is not None and unclear_done.is_set():
+                if not unclear or errors:
+                    stop.set()
+                for ID_s, values in pending.items():
+                    emit(ID_s, *values)
+                pending = None
+
+            # Enough rows collected --> the second read waits on the full queue
+            if pending is not None and len(pending) >= max_pending:
+                unclear_done.wait(0.1)
+                continue
+
+            try:
+                item = related_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if item is DONE:
+                gdb2_done = True
+                break
+
+            if pending is not None:
+                pending.setdefault(item[0], item[1:])
+            else:
+                emit(*item)
+
+        unclear_done.wait()
+        if pending is not None:
+            for ID_s, values in pending.items():
+                emit(ID_s, *values)
+
+        # Unclear obstacles that were not found from the second geodatabase
+        for ID_s, data in unclear.items():
+            if ID_s not in matched:
+                out_q.put(data[:6] + [None, None])
 
-        # Iterate through the dictioanry key by key and write data into a CSV
-        # -file
-        for row in input_dict.items():
-            row_only = row[1]
-            print(row_only)
-            w.writerow(row_only)
+    except BaseException as err:
+        # The writer removes the unfinished file
+        errors.append(err)
+        stop.set()
+        raise
 
-        print('\n ---> CSV - file is ready!')
-        print('\n ---> DATA PROCESSING IS DONE!')
+    finally:
+        # Empty the queue so that the second read is never left waiting
+        while not gdb2_done:
+            gdb2_done = related_q.get() is DONE
+
+        out_q.put(DONE)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+    print('Unclear: {0} rows'.format(written[0]))
+
+    return written[0]
 
 
 
@@ -178,6 +368,12 @@ shapef = 'EF_ACC_SECT_M'
 gdb1_fp = r'C:filepath_to_first_geodatabase_here\\' + shapef + '\\' + shapef + '.gdb\\' + shapef
 gdb2_fp = r'C:\TEMP\Export.gdb\Export_obs'
 
+# Finished reads are saved here until the whole run is done
+checkpoint_folder = r'C:\TEMP\checkpoints'
+
+# --> True = read both geodatabases at the same time (no checkpoints)
+pipelined = False
+
 # Checking the filepath
 # ---------------------------
     # First, check if the endfile already exists for the subject
@@ -203,26 +399,44 @@ finalOutput = 'Unclear_IDs_' + shapef + save_time + '.csv'
 
 # ==============================================================================
 
-# Create an empty Dictionary
-outputDict = {}
-
-# Run the get_GDB1_ID_s() - function to get the data of rows that are defined as
-# 'Unclear'
-gdb1_Data = get_GDB1_ID_s(gdb1_fp, outputDict)
-
-# Chech if the dictionary is empty (--> does the file have any items that are defined
-# as unclear during the analysis phase)
-if len(gdb1_Data) == 0:
-    print('---> The region has no unclear obsticles --> CSV-file cannot be created')
+if pipelined:
+    if write_csv_pipelined(gdb1_fp, gdb2_fp, finalOutput) == 0:
+        print('---> The region has no unclear obsticles --> CSV-file cannot be created')
 
 else:
-    # Run the get_related_records() -function, where the second parameter is the
-    # dictionary created in previous step --> gdb1_Data
-    gdb_1_2_DATA = get_related_records(gdb2_fp, gdb1_Data)
-
-    # Finally run the write_csv_from_dict() - funktion, where the second parameter
-    # is the updated dictionary created is previous step --> gdb_1_2_DATA
-    write_csv_from_dict(gdb_1_2_DATA, finalOutput)
+    # If an earlier run for the same shapefile stopped, the reads that were
+    # already finished are taken from the checkpoint
+    checkpoint = open_checkpoint(checkpoint_folder, 'Unclear_IDs_' + shapef)
+
+    # Create an empty Dictionary
+    outputDict = {}
+
+    # Run the get_GDB1_ID_s() - function to get the data of rows that are defined as
+    # 'Unclear'
+    # Note: the functions add to the dictionary given to them --> a retry after a
+    # failed read has to start again from a fresh copy
+    gdb1_Data = run_unit(checkpoint, gdb1_fp, lambda: get_GDB1_ID_s(gdb1_fp, dict(outputDict)))
+
+    # Chech if the dictionary is empty (--> does the file have any items that are defined
+    # as unclear during the analysis phase)
+    if len(gdb1_Data) == 0:
+        print('---> The region has no unclear obsticles --> CSV-file cannot be created')
+
+    else:
+        # Run the get_related_records() -function, where the second parameter is the
+        # dictionary created in previous step --> gdb1_Data
+        # Note: the result is built from both geodatabases --> a change in either
+        # of them runs the step again
+        gdb_1_2_DATA = run_unit(checkpoint, gdb2_fp,
+                                lambda: get_related_records(gdb2_fp, copy.deepcopy(gdb1_Data)),
+                                source=[gdb1_fp, gdb2_fp])
+
+        # Finally run the write_csv_from_dict() - funktion, where the second parameter
+        # is the updated dictionary created is previous step --> gdb_1_2_DATA
+        write_csv_from_dict(gdb_1_2_DATA, finalOutput)
+
+    # All steps are done --> the next run starts from the beginning
+    clear_checkpoint(checkpoint)
 
 
 print('DATA PROCESS IS DONE!')
@@ -0,0 +1,302 @@
+#************************************************************
+# -*- coding: cp1252 -*-
+#************************************************************
+#-------------------------------------------------------------------------------
+# Name:        obstacle_indexes.py
+#
+# Purpose:     Indexes for fast selections from a cached obstacle register
+#              (e.g. a Parquet/CSV snapshot of the feature classes), so that
+#              questions like "READY = 'yes' AND AGL_M_M >= 100 AND PROCEDURE
+#              in (...)" do not need a full scan of every feature class.
+#
+#              build_indexes() creates:
+#                 - a sorted index on AGL_M_M for height ranges
+#                 - bitmap indexes on PROCEDURE, READY, TYPE and SEGMENT
+#                 - a hash index (dictionary) on ID
+#
+#              query_register() combines the indexes first and reads the rows
+#              of the register only for the obstacles that match all of them.
+#              The selections of fetch_signif_obst.py, get_unclear_obst.py and
+#              calculate_point_distance.py are found at the end as examples.
+#
+# Author:      Mira Kajo - Autumn 2026
+#
+#-------------------------------------------------------------------------------
+
+# Import necessary modules
+import numpy as np
+import pandas as pd
+
+
+# Columns that get a bitmap index
+BITMAP_COLUMNS = ['PROCEDURE', 'READY', 'TYPE', 'SEGMENT']
+
+
+# ==============================================================================
+
+#                            DEFINE FUNCTIONS
+
+# ==============================================================================
+
+
+def load_register_snapshot(input_fp):
+    '''
+    Reads a cached obstacle register from a Parquet or CSV -file.
+
+    PARAMETERS
+    ----------
+    Filepath to the snapshot.
+
+    RETURNS
+    -------
+    A pandas DataFrame with a running row number as index.
+    '''
+    if input_fp.lower().endswith('.parquet'):
+        register = pd.read_parquet(input_fp)
+    else:
+        register = pd.read_csv(input_fp, encoding='latin-1',
+                               dtype={'COORD_N': str, 'COORD_E': str})
+
+    return register.reset_index(drop=True)
+
+
+def build_indexes(register, id_col='ID', height_col='AGL_M_M', bitmap_columns=BITMAP_COLUMNS):
+    '''
+    Builds the indexes of a register. Bitmaps are stored packed (8 rows in one
+    byte), so that combining them with AND / OR is fast and they take little
+    memory even for the whole of Finland.
+
+    PARAMETERS
+    ----------
+    The register as pandas DataFrame, the ID and height columns, and the
+    columns that get a bitmap index.
+
+    RETURNS
+    -------
+    A dictionary with the indexes.
+    '''
+    n_rows = len(register)
+
+    heights = pd.to_numeric(register[height_col], errors='coerce').to_numpy(dtype=float)
+    order = np.argsort(heights, kind='mergesort')
+
+    # NaN heights are sorted last --> leave them out of the range index
+    order = order[~np.isnan(heights[order])]
+
+    bitmaps = {}
+    for col in bitmap_columns:
+        if col not in register.columns:
+            continue
+
+        codes, values = pd.factorize(register[col].astype(str).str.strip())
+        bitmaps[col] = dict((value, np.packbits(codes == code)) for code, value in enumerate(values))
+
+    id_index = {}
+    for pos, obst_id in enumerate(register[id_col].astype(str)):
+        id_index.setdefault(obst_id, []).append(pos)
+
+    indexes = {'n_rows': n_rows,
+               'height_col': height_col,
+               'height_values': heights[order],
+               'height_rows': order,
+               'bitmaps': bitmaps,
+               'ids': id_index}
+
+    return indexes
+
+
+def rows_to_bitmap(rows, n_rows):
+    '''
+    Converts row positions into a packed bitmap.
+
+    PARAMETERS
+    ----------
+    A numpy array of row positions and the number of rows in the register.
+
+    RETURNS
+    -------
+    A packed bitmap (numpy uint8 array).
+    '''
+    mask = np.zeros(n_rows, dtype=bool)
+    mask[rows] = True
+
+    return np.packbits(mask)
+
+
+def bitmap_to_rows(bitmap, n_rows):
+    '''
+    Converts a packed bitmap into row positions.
+
+    PARAMETERS
+    ----------
+    A packed bitmap and the number of rows in the register.
+
+    RETURNS
+    -------
+    A numpy array of row positions.
+    '''
+    return np.flatnonzero(np.unpackbits(bitmap, count=n_rows))
+
+
+def get_height_rows(indexes, agl_min=None, agl_max=None):
+    '''
+    Fetches the rows whose height is between agl_min and agl_max (both
+    included) with a binary search of the sorted height index.
+
+    PARAMETERS
+    ----------
+    Indexes created with build_indexes() and the height limits (None = no
+    limit).
+
+    RETURNS
+    -------
+    A numpy array of row positions.
+    '''
+    values = indexes['height_values']
+
+    lo = 0 if agl_min is None else np.searchsorted(values, agl_min, side='left')
+    hi = len(values) if agl_max is None else np.searchsorted(values, agl_max, side='right')
+
+    return indexes['height_rows'][lo:hi]
+
+
+def get_category_bitmap(indexes, col, values):
+    '''
+    Combines the bitmaps of one column with OR (e.g. PROCEDURE in ('remove',
+    'dismantle')).
+
+    PARAMETERS
+    ----------
+    Indexes created with build_indexes(), the column name and a value or a
+    list of values. The values are compared as stripped strings, the same
+    way as they are stored in build_indexes() (e.g. 2 --> '2').
+
+    RETURNS
+    -------
+    A packed bitmap.
+    '''
+    if not isinstance(values, (list, tuple, set, np.ndarray, pd.Series)):
+        values = [values]
+
+    col_bitmaps = indexes['bitmaps'][col]
+    bitmap = np.zeros((indexes['n_rows'] + 7) // 8, dtype=np.uint8)
+
+    for value in values:
+        value = str(value).strip()
+        if value in col_bitmaps:
+            bitmap |= col_bitmaps[value]
+
+    return bitmap
+
+
+def query_register(register, indexes, where=None, agl_min=None, agl_max=None, ids=None):
+    '''
+    Selects rows of the register with the indexes.
+
+    The query is planned in this order:
+        1. If IDs are given, the hash index gives the candidate rows directly.
+        2. A height range gives (or narrows down) the candidate rows.
+        3. If there are only a few candidates, their bits are checked one by
+           one. Otherwise the bitmaps of the where -conditions are combined
+           with AND.
+    Only the rows that are left at the end are read from the register.
+
+    PARAMETERS
+    ----------
+    The register as pandas DataFrame, indexes created with build_indexes(), a
+    dictionary of bitmap conditions ({column: value or list of values}), the
+    height limits and a list of obstacle IDs.
+
+    RETURNS
+    -------
+    A pandas DataFrame with the matching rows.
+    '''
+    n_rows = indexes['n_rows']
+    where = where or {}
+
+    for col in where:
+        if col not in indexes['bitmaps']:
+            raise ValueError('Column {0} has no bitmap index'.format(col))
+
+    # 1. & 2. --> candidate rows from the ID or height index
+    candidates = None
+
+    if ids is not None:
+        # The same ID given twice --> the row only once
+        candidates = np.unique(np.array([pos for obst_id in ids
+                                         for pos in indexes['ids'].get(str(obst_id), [])], dtype=np.int64))
+
+    if agl_min is not None or agl_max is not None:
+        height_rows = get_height_rows(indexes, agl_min, agl_max)
+        if candidates is None:
+            candidates = height_rows
+        else:
+            candidates = np.intersect1d(candidates, height_rows)
+
+    # With only a few candidates, checking their bits is cheaper than
+    # combining whole bitmaps
+    if candidates is not None and len(candidates) < n_rows // 64:
+        candidates = np.sort(candidates)
+        for col, values in where.items():
+            bitmap = get_category_bitmap(indexes, col, values)
+            bits = (bitmap[candidates >> 3] >> (7 - (candidates & 7))) & 1
+            candidates = candidates[bits.astype(bool)]
+
+        return register.iloc[candidates]
+
+    # 3. --> combine the bitmaps
+    bitmap = None if candidates is None else rows_to_bitmap(candidates, n_rows)
+
+    for col, values in where.items():
+        col_bitmap = get_category_bitmap(indexes, col, values)
+        bitmap = col_bitmap if bitmap is None else bitmap & col_bitmap
+
+    if bitmap is None:
+        return register
+
+    return register.iloc[bitmap_to_rows(bitmap, n_rows)]
+
+
+def query_significant(register, indexes):
+    '''
+    Same selection as get_deleted_obst() in fetch_signif_obst.py.
+    '''
+    return query_register(register, indexes,
+                          where={'PROCEDURE': ['remove', 'dismantle', 'Out of date'],
+                                 'READY': 'yes'},
+                          agl_min=100)
+
+
+def query_unclear(register, indexes):
+    '''
+    Same selection as get_GDB1_ID_s() in get_unclear_obst.py.
+    '''
+    return query_register(register, indexes, where={'PROCEDURE': 'Unclear'})
+
+
+def query_relocated(register, indexes):
+    '''
+    Same selection as calculate_distance() in calculate_point_distance.py.
+    '''
+    return query_register(register, indexes, where={'PROCEDURE': 'Relocated'})
+
+
+# ==============================================================================
+
+#                      RUNNING THE SCRIPT
+
+# ==============================================================================
+
+if __name__ == '__main__':
+
+    # Set the filepath of the cached register
+    register_fp = r'I:\GIS\Filepath_to_cache\obstacle_register.parquet'
+
+    register = load_register_snapshot(register_fp)
+    indexes = build_indexes(register)
+
+    print('Significant: {0}'.format(len(query_significant(register, indexes))))
+    print('Unclear:     {0}'.format(len(query_unclear(register, indexes))))
+    print('Relocated:   {0}'.format(len(query_relocated(register, indexes))))
+
+    print('DATA PROCESS IS DONE!')
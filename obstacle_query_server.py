@@ -0,0 +1,345 @@
+#************************************************************
+# -*- coding: cp1252 -*-
+#************************************************************
+#-------------------------------------------------------------------------------
+# Name:        obstacle_query_server.py
+#
+# Purpose:     A local HTTP service that keeps the obstacle register in memory
+#              and answers the same questions as the scripts of this folder,
+#              without starting Python and arcpy for every question.
+#
+#              The register snapshot (Parquet/CSV) is read once, its text
+#              columns are stored as categories and the indexes of
+#              obstacle_indexes.py are built. When the snapshot files change,
+#              they are read again in the background and the new data is taken
+#              into use without stopping the service.
+#
+#              The service listens only on localhost. Answers are JSON:
+#
+#                 /significant                 --> fetch_signif_obst.py
+#                 /unclear                     --> get_unclear_obst.py
+#                 /relocated                   --> calculate_point_distance.py
+#                 /radius?lat=..&lon=..&r=..   --> obstacles within r meters
+#                                                  (RADIUS_DISTANCE_M)
+#                 /query?PROCEDURE=..&READY=..&agl_min=..&agl_max=..&ID=..
+#
+# Author:      Mira Kajo - Autumn 2026
+#
+#-------------------------------------------------------------------------------
+
+# Import necessary modules
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from calculate_surface_penetration import (EARTH_RADIUS_M, build_register_index,
+                                           convert_coords_to_DecDeg, get_bbox_candidates)
+from obstacle_indexes import (BITMAP_COLUMNS, load_register_snapshot, build_indexes,
+                              query_register, query_significant, query_unclear,
+                              query_relocated)
+
+
+class UnknownQueryError(Exception):
+    '''
+    Raised by answer_query() for a path that the service does not know.
+    '''
+    pass
+
+
+# ==============================================================================
+
+#                            DEFINE FUNCTIONS
+
+# ==============================================================================
+
+
+def get_distance_m(lat1, lon1, lat2, lon2):
+    '''
+    Calculates the great circle distance between points (haversine).
+
+    PARAMETERS
+    ----------
+    Latitudes and longitudes in decimal degrees (numbers or numpy arrays).
+
+    RETURNS
+    -------
+    Distance in meters.
+    '''
+    lat1, lon1, lat2, lon2 = [np.radians(v) for v in (lat1, lon1, lat2, lon2)]
+
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def load_state(register_fp, related_fp=None, previous_fp=None):
+    '''
+    Reads the snapshots and builds everything the service needs.
+
+    PARAMETERS
+    ----------
+    Filepaths to the register snapshot, to the snapshot with OWNER and DIAARI
+    (Export_obs) and to the snapshot of the previous obstacle locations
+    (flight_obs). The last two can be None.
+
+    RETURNS
+    -------
+    A dictionary with the register, its indexes and the modification times of
+    the snapshots.
+    '''
+    register = load_register_snapshot(register_fp)
+
+    # Categories take much less memory than repeated strings
+    for col in BITMAP_COLUMNS:
+        if col in register.columns:
+            register[col] = register[col].astype('category')
+
+    # OWNER and DIAARI for the unclear obstacles
+    if related_fp:
+        related = load_register_snapshot(related_fp)[['ID', 'OWNER', 'DIAARI']]
+        related = related.drop_duplicates('ID')
+        register = register.merge(related, on='ID', how='left')
+
+    # Distance to the previous location for the relocated obstacles
+    if previous_fp:
+        previous = load_register_snapshot(previous_fp)[['ID', 'COORD_N', 'COORD_E']].drop_duplicates('ID')
+        previous = previous.rename(columns={'COORD_N': 'PREV_N', 'COORD_E': 'PREV_E'})
+        register = register.merge(previous, on='ID', how='left')
+
+        has_prev = register['PREV_N'].notna().to_numpy()
+        dist = np.full(len(register), np.nan)
+        dist[has_prev] = get_distance_m(convert_coords_to_DecDeg(register['COORD_N'][has_prev]),
+                                        convert_coords_to_DecDeg(register['COORD_E'][has_prev]),
+                                        convert_coords_to_DecDeg(register['PREV_N'][has_prev]),
+                                        convert_coords_to_DecDeg(register['PREV_E'][has_prev]))
+        register['DISTANCE_M'] = np.round(dist, 2)
+
+    files = [fp for fp in (register_fp, related_fp, previous_fp) if fp]
+
+    state = {'register': register,
+             'indexes': build_indexes(register),
+             'points': build_register_index(register, height_col=None),
+             'files': files,
+             'mtimes': [os.path.getmtime(fp) for fp in files],
+             'loaded': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+    return state
+
+
+def to_json_rows(data):
+    '''
+    Converts a DataFrame into a list of dictionaries that can be saved as JSON.
+
+    PARAMETERS
+    ----------
+    A pandas DataFrame.
+
+    RETURNS
+    -------
+    A list of dictionaries.
+    '''
+    data = data.astype(object).where(data.notna(), None)
+
+    return data.to_dict('records')
+
+
+def answer_query(state, path, params):
+    '''
+    Answers one question of a client.
+
+    PARAMETERS
+    ----------
+    The state created with load_state(), the path of the request (e.g.
+    '/significant') and the query parameters as a dictionary of lists.
+
+    RETURNS
+    -------
+    A pandas DataFrame with the answer.
+    '''
+    register = state['register']
+    indexes = state['indexes']
+
+    def get_float(name):
+        return float(params[name][0]) if name in params else None
+
+    if path == '/significant':
+        return query_significant(register, indexes)
+
+    if path == '/unclear':
+        cols = [col for col in ('ID', 'TYPE', 'AGL_M_M', 'READY', 'RETURN_CODE',
+                                'SEGMENT', 'OWNER', 'DIAARI') if col in register.columns]
+        return query_unclear(register, indexes)[cols]
+
+    if path == '/relocated':
+        if 'DISTANCE_M' not in register.columns:
+            raise ValueError('The service was started without the previous locations')
+        relocated = query_relocated(register, indexes)
+        return relocated[relocated['DISTANCE_M'].notna()][['ID', 'DISTANCE_M']]
+
+    if path == '/radius':
+        lat, lon, radius = get_float('lat'), get_float('lon'), get_float('r')
+        if None in (lat, lon, radius):
+            raise ValueError('radius needs the parameters lat, lon and r (meters)')
+
+        # Bounding box of the circle first, then the exact distance
+        dlat = np.degrees(radius / EARTH_RADIUS_M)
+        dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+        points = state['points']
+        cand = get_bbox_candidates(points, (lat - dlat, lon - dlon, lat + dlat, lon + dlon))
+
+        dist = get_distance_m(lat, lon, points['lat'][cand], points['lon'][cand])
+        near = dist <= radius
+
+        result = register.iloc[points['rows'][cand[near]]].copy()
+        result['RADIUS_DISTANCE_M'] = np.round(dist[near], 2)
+        return result.sort_values('RADIUS_DISTANCE_M')
+
+    if path == '/query':
+        where = dict((col, params[col]) for col in indexes['bitmaps'] if col in params)
+        return query_register(register, indexes, where=where,
+                              agl_min=get_float('agl_min'), agl_max=get_float('agl_max'),
+                              ids=params.get('ID'))
+
+    raise UnknownQueryError(path)
+
+
+def make_handler(server_state):
+    '''
+    Creates the request handler class of the service. The handler reads the
+    current state from server_state['state'] for every request, so a reload
+    only has to replace that one value.
+
+    PARAMETERS
+    ----------
+    A dictionary with the key 'state'.
+
+    RETURNS
+    -------
+    A BaseHTTPRequestHandler class.
+    '''
+    class ObstacleHandler(BaseHTTPRequestHandler):
+
+        def send_json(self, status, body):
+            data = json.dumps(body, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            state = server_state['state']
+
+            if url.path == '/status':
+                self.send_json(200, {'rows': len(state['register']), 'loaded': state['loaded']})
+                return
+
+            start = time.time()
+            try:
+                result = answer_query(state, url.path, params)
+            except UnknownQueryError:
+                self.send_json(404, {'error': 'Unknown query {0}'.format(url.path)})
+                return
+            except ValueError as err:
+                self.send_json(400, {'error': str(err)})
+                return
+            except Exception as err:
+                self.send_json(500, {'error': '{0}: {1}'.format(type(err).__name__, err)})
+                return
+
+            self.send_json(200, {'count': len(result),
+                                 'ms': round((time.time() - start) * 1000, 2),
+                                 'rows': to_json_rows(result)})
+
+        def log_message(self, format, *args):
+            # No line to the console for every request
+            pass
+
+    return ObstacleHandler
+
+
+def watch_snapshots(server_state, interval=10.0):
+    '''
+    Checks the snapshot files every few seconds. If one of them has changed,
+    the data is read again and taken into use. Requests are answered with the
+    old data while the new data is being read.
+
+    PARAMETERS
+    ----------
+    A dictionary with the key 'state' and the interval in seconds.
+
+    RETURNS
+    -------
+    None (runs until the service stops)
+    '''
+    while True:
+        time.sleep(interval)
+        state = server_state['state']
+
+        try:
+            mtimes = [os.path.getmtime(fp) for fp in state['files']]
+            if mtimes == state['mtimes']:
+                continue
+
+            # Wait until the file has been completely written
+            time.sleep(interval)
+            server_state['state'] = load_state(*server_state['args'])
+            print('---> Snapshot reloaded: {0} rows'.format(len(server_state['state']['register'])))
+
+        except Exception as err:
+            print('---> Reloading the snapshot failed, using the old data: {0}'.format(err))
+
+
+def run_server(register_fp, related_fp=None, previous_fp=None, port=8765, reload_interval=10.0):
+    '''
+    Starts the service on localhost. Every request is handled in its own
+    thread.
+
+    PARAMETERS
+    ----------
+    Filepaths to the snapshots (see load_state()), the port and how often the
+    snapshots are checked for changes (seconds).
+
+    RETURNS
+    -------
+    None (runs until stopped with Ctrl+C)
+    '''
+    args = (register_fp, related_fp, previous_fp)
+    server_state = {'state': load_state(*args), 'args': args}
+
+    watcher = threading.Thread(target=watch_snapshots, args=(server_state, reload_interval))
+    watcher.daemon = True
+    watcher.start()
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(server_state))
+    print('---> Serving {0} obstacles at http://127.0.0.1:{1}/'.format(
+        len(server_state['state']['register']), port))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# ==============================================================================
+
+#                      RUNNING THE SCRIPT
+
+# ==============================================================================
+
+if __name__ == '__main__':
+
+    # Set the filepaths of the snapshots
+    register_fp = r'I:\GIS\Filepath_to_cache\obstacle_register.parquet'
+    related_fp = r'I:\GIS\Filepath_to_cache\Export_obs.parquet'
+    previous_fp = r'I:\GIS\Filepath_to_cache\flight_obs.parquet'
+
+    run_server(register_fp, related_fp, previous_fp)
@@ -0,0 +1,391 @@
+#************************************************************
+# -*- coding: cp1252 -*-
+#************************************************************
+#-------------------------------------------------------------------------------
+# Name:        output_sinks.py
+#
+# Purpose:     A common way for the scripts to write their output files.
+#
+#              Instead of writing one row at a time with csv.writer, the rows
+#              are collected into batches that are written as column chunks.
+#              The output can be CSV, gzip or zstd compressed CSV, Parquet or
+#              GeoJSON, chosen from the file extension. The file is first
+#              written with a temporary name and renamed only when it is
+#              complete, so a failed run never leaves a half written file.
+#
+#              With write_partitioned() the output can also be split into
+#              separate files by a column (e.g. apron or SEGMENT), which are
+#              written in parallel.
+#
+# Author:      Mira Kajo - Autumn 2026
+#
+#-------------------------------------------------------------------------------
+
+# Import necessary modules
+import os
+import io
+import gzip
+import json
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+
+# File extensions and the matching output formats
+FORMATS = [('.csv.gz', 'csv.gz'),
+           ('.csv.zst', 'csv.zst'),
+           ('.csv', 'csv'),
+           ('.parquet', 'parquet'),
+           ('.geojson', 'geojson')]
+
+
+# ==============================================================================
+
+#                            DEFINE FUNCTIONS
+
+# ==============================================================================
+
+
+def get_format(output_fp):
+    '''
+    Finds the output format from the file extension.
+
+    PARAMETERS
+    ----------
+    Filepath to the output file.
+
+    RETURNS
+    -------
+    Name of the format ('csv', 'csv.gz', 'csv.zst', 'parquet' or 'geojson').
+    '''
+    for ext, fmt in FORMATS:
+        if output_fp.lower().endswith(ext):
+            return fmt
+
+    raise ValueError('Unknown output format for {0}'.format(output_fp))
+
+
+def open_sink(output_fp, columns, fmt=None, batch_size=50000, encoding='utf-8',
+              lon_col='Longitude', lat_col='Latitude'):
+    '''
+    Opens an output file for writing. The rows given to write_rows() are kept
+    in memory until there are batch_size of them, and then written at once.
+
+    PARAMETERS
+    ----------
+    Filepath to the output file, a list of column names, the format (if not
+    given, taken from the file extension), the number of rows in one batch,
+    the text encoding of CSV -files and the coordinate columns used for
+    GeoJSON points.
+
+    RETURNS
+    -------
+    A dictionary that is given to write_rows() and close_sink().
+    '''
+    fmt = fmt or get_format(output_fp)
+    tmp_fp = output_fp + '.tmp'
+
+    sink = {'fp': output_fp,
+            'tmp_fp': tmp_fp,
+            'fmt': fmt,
+            'columns': list(columns),
+            'batch_size': batch_size,
+            'rows': [],
+            'count': 0,
+            'lon_col': lon_col,
+            'lat_col': lat_col,
+            'handle': None,
+            'raw': None,
+            'writer': None}
+
+    if fmt == 'csv':
+        sink['handle'] = open(tmp_fp, 'w', newline='', encoding=encoding)
+
+    elif fmt == 'csv.gz':
+        sink['handle'] = gzip.open(tmp_fp, 'wt', newline='', encoding=encoding)
+
+    elif fmt == 'csv.zst':
+        import zstandard
+        sink['raw'] = open(tmp_fp, 'wb')
+        zst = zstandard.ZstdCompressor().stream_writer(sink['raw'])
+        sink['handle'] = io.TextIOWrapper(zst, newline='', encoding=encoding)
+
+    elif fmt == 'geojson':
+        sink['handle'] = open(tmp_fp, 'w', encoding='utf-8')
+        sink['handle'].write('{"type": "FeatureCollection", "features": [\n')
+
+    elif fmt != 'parquet':
+        raise ValueError('Unknown output format: {0}'.format(fmt))
+
+    # Header row for CSV -files
+    if fmt.startswith('csv'):
+        pd.DataFrame(columns=sink['columns']).to_csv(sink['handle'], index=False)
+
+    return sink
+
+
+def write_chunk(sink, chunk):
+    '''
+    Writes a DataFrame into the output file straight away.
+
+    PARAMETERS
+    ----------
+    Sink created with open_sink() and a pandas DataFrame with the columns of
+    the sink.
+
+    RETURNS
+    -------
+    None
+    '''
+    if len(chunk) == 0:
+        return
+
+    chunk = chunk[sink['columns']]
+    fmt = sink['fmt']
+
+    if fmt.startswith('csv'):
+        chunk.to_csv(sink['handle'], header=False, index=False)
+
+    elif fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Text columns are always written as strings. Otherwise a first chunk
+        # where e.g. SEGMENT is all empty would give the column a null type,
+        # and the next chunk with text in it could not be written.
+        chunk = chunk.copy()
+        text_cols = [col for col in chunk.columns
+                     if chunk[col].dtype == object or pd.api.types.is_string_dtype(chunk[col])]
+        for col in text_cols:
+            chunk[col] = chunk[col].astype(object).where(chunk[col].isna(), chunk[col].astype(str))
+
+        # The schema of the first chunk is used for the whole file
+        if sink['writer'] is None:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            schema = pa.schema([pa.field(field.name, pa.string()) if field.name in text_cols else field
+                                for field in table.schema], metadata=table.schema.metadata)
+            sink['writer'] = pq.ParquetWriter(sink['tmp_fp'], schema)
+
+        table = pa.Table.from_pandas(chunk, schema=sink['writer'].schema, preserve_index=False)
+        sink['writer'].write_table(table)
+
+    elif fmt == 'geojson':
+        props = [col for col in sink['columns'] if col not in (sink['lon_col'], sink['lat_col'])]
+        lines = []
+
+        # Missing values as null instead of NaN, which is not valid JSON
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+
+        for rec in chunk.to_dict('records'):
+            feature = {'type': 'Feature',
+                       'geometry': {'type': 'Point',
+                                    'coordinates': [float(rec[sink['lon_col']]), float(rec[sink['lat_col']])]},
+                       'properties': dict((col, rec[col]) for col in props)}
+            lines.append(json.dumps(feature, default=str))
+
+        # Features are separated with commas --> add one before the first
+        # feature of every chunk except the very first one
+        if sink['count'] > 0:
+            sink['handle'].write(',\n')
+        sink['handle'].write(',\n'.join(lines))
+
+    sink['count'] += len(chunk)
+
+
+def flush_sink(sink):
+    '''
+    Writes the rows that are waiting in memory into the output file.
+
+    PARAMETERS
+    ----------
+    Sink created with open_sink().
+
+    RETURNS
+    -------
+    None
+    '''
+    if sink['rows']:
+        write_chunk(sink, pd.DataFrame(sink['rows'], columns=sink['columns']))
+        sink['rows'] = []
+
+
+def write_rows(sink, rows):
+    '''
+    Adds rows to the output. The rows are written when the batch is full.
+
+    PARAMETERS
+    ----------
+    Sink created with open_sink() and a list of rows (lists in the same order
+    as the columns of the sink).
+
+    RETURNS
+    -------
+    None
+    '''
+    sink['rows'].extend(rows)
+
+    if len(sink['rows']) >= sink['batch_size']:
+        flush_sink(sink)
+
+
+def close_sink(sink):
+    '''
+    Writes the remaining rows, closes the file and renames it from the
+    temporary name to the final one.
+
+    PARAMETERS
+    ----------
+    Sink created with open_sink().
+
+    RETURNS
+    -------
+    Number of rows written.
+    '''
+    flush_sink(sink)
+
+    if sink['fmt'] == 'geojson':
+        sink['handle'].write('\n]}\n')
+
+    if sink['fmt'] == 'parquet' and sink['writer'] is None:
+        # No rows at all --> still write a file with the right columns
+        pd.DataFrame(columns=sink['columns']).to_parquet(sink['tmp_fp'], index=False)
+
+    for key in ('handle', 'writer', 'raw'):
+        if sink[key] is not None:
+            sink[key].close()
+
+    os.replace(sink['tmp_fp'], sink['fp'])
+
+    return sink['count']
+
+
+def abort_sink(sink):
+    '''
+    Closes the output file and removes it without replacing an earlier file
+    with the same name.
+
+    PARAMETERS
+    ----------
+    Sink created with open_sink().
+
+    RETURNS
+    -------
+    None
+    '''
+    for key in ('handle', 'writer', 'raw'):
+        if sink[key] is not None:
+            try:
+                sink[key].close()
+            except Exception:
+                pass
+
+    if os.path.exists(sink['tmp_fp']):
+        os.remove(sink['tmp_fp'])
+
+
+@contextmanager
+def output_sink(output_fp, columns, **kwargs):
+    '''
+    Opens a sink that is used in a with -statement. The file is renamed to its
+    final name at the end of the with -block, or removed if an error occurs.
+
+    PARAMETERS
+    ----------
+    Same as in open_sink().
+
+    RETURNS
+    -------
+    Sink created with open_sink().
+    '''
+    sink = open_sink(output_fp, columns, **kwargs)
+
+    try:
+        yield sink
+    except BaseException:
+        abort_sink(sink)
+        raise
+
+    close_sink(sink)
+
+
+def get_partition_fp(output_fp, value, suffix=''):
+    '''
+    Adds the partition value into the filename, before the file extension
+    (e.g. obst.csv.gz --> obst_EFHK.csv.gz). Characters that cannot be in a
+    filename are replaced with '_'. Missing values (None/NaN) and empty values
+    go to the partition '_none'.
+
+    PARAMETERS
+    ----------
+    Filepath to the output file, the partition value and a suffix added after
+    the value (used when two values would give the same filename).
+
+    RETURNS
+    -------
+    Filepath to the partition file.
+    '''
+    fmt_ext = [ext for ext, fmt in FORMATS if output_fp.lower().endswith(ext)]
+    ext_len = len(fmt_ext[0]) if fmt_ext else len(os.path.splitext(output_fp)[1])
+
+    if value is None or (isinstance(value, float) and value != value):
+        name = '_none'
+    else:
+        name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in str(value).strip())
+        name = name or '_none'
+
+    name += suffix
+
+    return output_fp[:len(output_fp) - ext_len] + '_' + name + output_fp[len(output_fp) - ext_len:]
+
+
+def write_partitioned(data, output_fp, partition_col, max_workers=4, **kwargs):
+    '''
+    Splits a DataFrame by the values of a column and writes each part into its
+    own file. The files are written in parallel. Rows with an empty value are
+    written into their own '_none' partition instead of being left out.
+
+    PARAMETERS
+    ----------
+    A pandas DataFrame, filepath to the output file (the partition value is
+    added to the filename), the column used for splitting, the number of files
+    written at the same time and other parameters for open_sink().
+
+    RETURNS
+    -------
+    A dictionary where the partition value is the key and the filepath the
+    value.
+    '''
+    columns = list(data.columns)
+
+    # The empty values are taken out before grouping. groupby(dropna=False)
+    # fails on categorical columns with empty values in pandas 2.x.
+    values = data[partition_col].astype(object)
+    missing = values.isna().to_numpy()
+
+    parts = [(value, part) for value, part in data[~missing].groupby(values[~missing], sort=True)]
+    if missing.any():
+        parts.append((None, data[missing]))
+
+    # Two values can give the same filename (e.g. 'A/B' and 'A_B') --> add a
+    # number to the later ones, so that two threads never write the same file
+    part_fps = []
+    used = set()
+    for value, part in parts:
+        part_fp = get_partition_fp(output_fp, value)
+        count = 1
+        while part_fp.lower() in used:
+            count += 1
+            part_fp = get_partition_fp(output_fp, value, '_{0}'.format(count))
+        used.add(part_fp.lower())
+        part_fps.append(part_fp)
+
+    def write_part(item):
+        (value, part), part_fp = item
+        with output_sink(part_fp, columns, **kwargs) as sink:
+            write_chunk(sink, part)
+        return (value, part_fp)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        written = dict(pool.map(write_part, zip(parts, part_fps)))
+
+    return written
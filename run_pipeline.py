@@ -0,0 +1,427 @@
+#************************************************************
+# -*- coding: cp1252 -*-
+#************************************************************
+#-------------------------------------------------------------------------------
+# Name:        run_pipeline.py
+#
+# Purpose:     A small pipeline framework for the obstacle scripts. Instead of
+#              running every step from top to bottom each time, the steps are
+#              declared as stages that have explicit inputs (other stages,
+#              files and parameters) and one output.
+#
+#              Every stage gets a hash calculated from its function, parameters,
+#              input files and the hashes of the stages it depends on. If a
+#              cached result with the same hash exists, it is read from the
+#              cache folder (DataFrames as Parquet) instead of running the stage
+#              again. Stages that do not depend on each other (e.g. different
+#              aprons) are run in parallel.
+#
+#              This way, changing only the final export reruns only the export.
+#
+# Author:      Mira Kajo - Autumn 2026
+#
+#-------------------------------------------------------------------------------
+
+# Import necessary modules
+import os
+import json
+import pickle
+import hashlib
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+
+# ==============================================================================
+
+#                            DEFINE FUNCTIONS
+
+# ==============================================================================
+
+
+def define_stage(name, func, inputs=None, params=None, files=None, outputs=None,
+                 code_deps=None, version=None):
+    '''
+    Declares one stage of the pipeline.
+
+    The stage is run as func(*upstream_results, **params), where the upstream
+    results are the outputs of the stages listed in inputs, in the same order.
+
+    PARAMETERS
+    ----------
+    Name of the stage, the function that is run, a list of upstream stage
+    names, a dictionary of parameters, a list of input filepaths (files or
+    folders, e.g. geodatabases) that the stage reads and a list of output
+    filepaths that the stage writes. If an output file is missing, the stage
+    is run again even if its cached result exists.
+
+    The source code of func is part of the stage hash. If func calls other
+    functions (e.g. calculate_all_penetrations() calls calculate_penetration()),
+    give those functions or their modules in code_deps, so that editing them
+    invalidates the cached result, too. The version (any string) can be
+    changed by hand to force the stage to run again.
+
+    RETURNS
+    -------
+    A dictionary that describes the stage.
+    '''
+    stage = {'name': name,
+             'func': func,
+             'inputs': list(inputs or []),
+             'params': dict(params or {}),
+             'files': list(files or []),
+             'outputs': list(outputs or []),
+             'code_deps': list(code_deps or []),
+             'version': version}
+
+    return stage
+
+
+def hash_path(path):
+    '''
+    Calculates a hash for an input file or folder. Files are hashed from their
+    content. Folders (like .gdb) are hashed from the names, sizes and
+    modification times of the files in them, as reading a whole geodatabase
+    would take as long as the stage itself.
+
+    PARAMETERS
+    ----------
+    Filepath to a file or folder.
+
+    RETURNS
+    -------
+    A hex string.
+    '''
+    sha = hashlib.sha256()
+
+    if os.path.isdir(path):
+        for root, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                fpath = os.path.join(root, filename)
+                stat = os.stat(fpath)
+                sha.update('{0}|{1}|{2}'.format(os.path.relpath(fpath, path),
+                                                stat.st_size, stat.st_mtime).encode('utf-8'))
+
+    elif os.path.exists(path):
+        with open(path, 'rb') as inp:
+            for chunk in iter(lambda: inp.read(1024 * 1024), b''):
+                sha.update(chunk)
+
+    else:
+        sha.update(('missing:' + path).encode('utf-8'))
+
+    return sha.hexdigest()
+
+
+def get_source(obj):
+    '''
+    Reads the source code of a function (only the function) or a module (the
+    whole file). Functions without source code (e.g. built-ins) are
+    identified by their name.
+
+    PARAMETERS
+    ----------
+    A function or module.
+
+    RETURNS
+    -------
+    A string.
+    '''
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return getattr(obj, '__qualname__', getattr(obj, '__name__', repr(obj)))
+
+
+def hash_stage(stage, upstream_hashes):
+    '''
+    Calculates the hash of a stage from the source code of its function and
+    code dependencies, its version, parameters, input files and the hashes of
+    its upstream stages.
+
+    PARAMETERS
+    ----------
+    Stage created with define_stage() and a list of upstream hashes.
+
+    RETURNS
+    -------
+    A hex string.
+    '''
+    # Only the function itself and the given code dependencies are used, so
+    # that editing another stage of the same file does not invalidate this one
+    sha = hashlib.sha256()
+    sha.update(stage['name'].encode('utf-8'))
+    sha.update(get_source(stage['func']).encode('utf-8'))
+
+    for dep in stage['code_deps']:
+        sha.update(get_source(dep).encode('utf-8'))
+
+    sha.update(str(stage['version']).encode('utf-8'))
+    sha.update(json.dumps(stage['params'], sort_keys=True, default=str).encode('utf-8'))
+
+    for path in stage['files']:
+        sha.update(hash_path(path).encode('utf-8'))
+
+    for upstream in upstream_hashes:
+        sha.update(upstream.encode('utf-8'))
+
+    return sha.hexdigest()
+
+
+def get_stage_levels(stages):
+    '''
+    Sorts the stages into levels, so that every stage is on a later level than
+    the stages it depends on. Stages on the same level can be run in parallel.
+
+    PARAMETERS
+    ----------
+    A dictionary where the stage name is the key and the stage the value.
+
+    RETURNS
+    -------
+    A list of lists of stage names.
+    '''
+    for stage in stages.values():
+        for name in stage['inputs']:
+            if name not in stages:
+                raise ValueError('Stage {0} depends on unknown stage {1}'.format(stage['name'], name))
+
+    levels = []
+    done = set()
+
+    while len(done) < len(stages):
+        level = [name for name, stage in stages.items()
+                 if name not in done and all(inp in done for inp in stage['inputs'])]
+
+        if not level:
+            raise ValueError('The pipeline has a cycle between stages: {0}'.format(
+                sorted(set(stages) - done)))
+
+        levels.append(level)
+        done.update(level)
+
+    return levels
+
+
+def has_cached_result(cache_fp):
+    '''
+    Checks if a stage has a cached result without reading it.
+
+    PARAMETERS
+    ----------
+    The cache filepath without the file extension.
+
+    RETURNS
+    -------
+    True or False
+    '''
+    return any(os.path.exists(cache_fp + ext) for ext in ('.parquet', '.done', '.pkl'))
+
+
+def read_cached_result(cache_fp):
+    '''
+    Reads a cached result of a stage. DataFrames are stored as Parquet, stages
+    that return nothing (e.g. exports) as an empty '.done' -file and everything
+    else as pickle.
+
+    PARAMETERS
+    ----------
+    The cache filepath without the file extension.
+
+    RETURNS
+    -------
+    The result of the stage.
+    '''
+    if os.path.exists(cache_fp + '.parquet'):
+        return pd.read_parquet(cache_fp + '.parquet')
+
+    if os.path.exists(cache_fp + '.pkl'):
+        with open(cache_fp + '.pkl', 'rb') as inp:
+            return pickle.load(inp)
+
+    return None
+
+
+def write_cached_result(cache_fp, result):
+    '''
+    Saves the result of a stage into the cache. The file is first written with
+    a temporary name and then renamed, so that a stopped run never leaves a
+    half written cache file behind.
+
+    PARAMETERS
+    ----------
+    The cache filepath without the file extension and the result of the stage.
+
+    RETURNS
+    -------
+    None
+    '''
+    if isinstance(result, pd.DataFrame):
+        out_fp = cache_fp + '.parquet'
+        result.to_parquet(out_fp + '.tmp', index=False)
+
+    elif result is None:
+        out_fp = cache_fp + '.done'
+        open(out_fp + '.tmp', 'wb').close()
+
+    else:
+        out_fp = cache_fp + '.pkl'
+        with open(out_fp + '.tmp', 'wb') as out:
+            pickle.dump(result, out)
+
+    os.replace(out_fp + '.tmp', out_fp)
+
+
+def run_pipeline(stage_list, cache_folder, max_workers=4):
+    '''
+    Runs the stages of the pipeline in the right order. A stage is run only if
+    its cache folder does not have a result with the same hash; otherwise the
+    cached result is used. Cached results are read only when a stage that
+    needs them has to be run, so an unchanged pipeline reads nothing but the
+    input files for hashing.
+
+    PARAMETERS
+    ----------
+    A list of stages created with define_stage(), the folder where the cached
+    results are saved and the number of stages that can be run in parallel.
+
+    RETURNS
+    -------
+    A dictionary where the stage name is the key and the cache filepath
+    (without the file extension) of its result the value. Use
+    read_cached_result() to read the results that are needed.
+    '''
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+
+    stages = {}
+    for stage in stage_list:
+        if stage['name'] in stages:
+            raise ValueError('Stage {0} is defined twice'.format(stage['name']))
+        stages[stage['name']] = stage
+
+    hashes = {}
+    cache_fps = {}
+    results = {}
+    lock = threading.Lock()
+    name_locks = dict((name, threading.Lock()) for name in stages)
+
+    def get_result(name):
+        # Several stages of the same level can need the same upstream result
+        # --> it is read only once, but different results are read in
+        # parallel
+        with name_locks[name]:
+            with lock:
+                if name in results:
+                    return results[name]
+
+            result = read_cached_result(cache_fps[name])
+
+            with lock:
+                results[name] = result
+            return result
+
+    def run_stage(name):
+        stage = stages[name]
+
+        if has_cached_result(cache_fps[name]) and all(os.path.exists(fp) for fp in stage['outputs']):
+            print('cached:     {0}'.format(name))
+            return
+
+        print('processing: {0}'.format(name))
+        upstream = [get_result(inp) for inp in stage['inputs']]
+        result = stage['func'](*upstream, **stage['params'])
+        write_cached_result(cache_fps[name], result)
+
+        with lock:
+            results[name] = result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for level in get_stage_levels(stages):
+
+            # Hashes depend only on the upstream hashes, not on the results
+            for name in level:
+                hashes[name] = hash_stage(stages[name], [hashes[inp] for inp in stages[name]['inputs']])
+                cache_fps[name] = os.path.join(cache_folder, name + '_' + hashes[name][:16])
+
+            # list() --> raises the first error of the level before moving on
+            list(pool.map(run_stage, level))
+
+    return cache_fps
+
+
+def export_penetration_csv(vss_df, output_csv):
+    '''
+    Final export stage of the example pipeline - saves the penetrating
+    obstacles with decimal degree coordinates into a CSV -file.
+
+    PARAMETERS
+    ----------
+    DataFrame created with calculate_penetration() and an output CSV -file.
+
+    RETURNS
+    -------
+    None
+    '''
+    from calculate_surface_penetration import convert_coords_to_DecDeg
+
+    data = vss_df.copy()
+    data['Latitude'] = convert_coords_to_DecDeg(data['N'])
+    data['Longitude'] = convert_coords_to_DecDeg(data['E'])
+    data.to_csv(output_csv, sep=',', index=False)
+
+
+# ==============================================================================
+
+#                      RUNNING THE SCRIPT
+
+# ==============================================================================
+
+if __name__ == '__main__':
+
+    import calculate_surface_penetration as csp
+    import add_terrain_height as ath
+
+    # Set input and output filepaths
+    register_csv = r'C:Path_to_input_file\obstacle_register.csv'
+    dem_fp = r'C:Path_to_input_file\DEM\Finland_DEM_10m.flt'
+    surfaces_folder = r'C:Path_to_input_file\VSS_surfaces'
+    output_folder = r'C:Path_to_output_folder\VSS'
+    cache_folder = r'C:Path_to_output_folder\VSS\cache'
+
+    # --> ADD OR REMOVE APRONS HERE:
+    aprons = ['EFHK', 'EFKE', 'EFRO']
+
+    # Stages that are shared by all aprons
+    pipeline = [
+        define_stage('register', pd.read_csv, params={'filepath_or_buffer': register_csv,
+                                                      'dtype': {'COORD_N': str, 'COORD_E': str}},
+                     files=[register_csv]),
+
+        # The register has only the height above ground --> AMSL_FT from the
+        # DEM. The DEM folder is hashed from its file times, as reading the
+        # whole DEM for the hash would take as long as the stage itself.
+        define_stage('register_amsl', ath.add_terrain_height_from_file, inputs=['register'],
+                     params={'dem_fp': dem_fp}, files=[os.path.dirname(dem_fp)], code_deps=[ath]),
+        define_stage('register_index', csp.build_register_index, inputs=['register_amsl'],
+                     params={'height_col': 'AMSL_FT'})]
+
+    # Stages for each apron --> the aprons are run in parallel
+    for apron in aprons:
+        surfaces_csv = os.path.join(surfaces_folder, apron + '_surfaces.csv')
+        output_csv = os.path.join(output_folder, apron + '_VSS_Point_Coord.csv')
+
+        pipeline.append(define_stage('surfaces_' + apron, csp.read_surfaces_from_csv,
+                                     params={'input_csv': surfaces_csv}, files=[surfaces_csv]))
+        pipeline.append(define_stage('penetration_' + apron, csp.calculate_all_penetrations,
+                                     inputs=['surfaces_' + apron, 'register_index'],
+                                     code_deps=[csp]))
+        pipeline.append(define_stage('export_' + apron, export_penetration_csv,
+                                     inputs=['penetration_' + apron],
+                                     params={'output_csv': output_csv}, outputs=[output_csv]))
+
+    run_pipeline(pipeline, cache_folder)
+
+    print('DATA PROCESSING IS READY!')